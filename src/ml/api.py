@@ -1,15 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
 import pandas as pd
 import json
-from .predict import PredictionService
+from .predict import PredictionService, resolve_model_path
+from .scenarios import evaluate_scenarios
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
 import os
+import hmac
 import asyncio
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.background import BackgroundTask
+from .response_cache import ResponseCache, etag_matches
+from .feature_store import FeatureStore
+from .ingest_data import SentimentStreamSource, feed_from_config, load_config
+from .zone_updates import format_event
 
 app = FastAPI(
     title="EquiHome Traffic Light System API",
@@ -29,6 +38,107 @@ app.add_middleware(
 # Initialize prediction service
 predictor = PredictionService()
 
+# Responses keyed on request body and model/predictions state
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024')),
+    max_bytes=int(float(os.getenv('RESPONSE_CACHE_MAX_MB', '64')) * 2**20)
+)
+
+# Seconds between keep-alive comments on idle zone update streams
+ZONE_STREAM_HEARTBEAT = float(os.getenv('ZONE_STREAM_HEARTBEAT_SECONDS', '15'))
+
+# Seconds between checks of current_predictions.csv for zone changes to push, and of the
+# feature store for rows written by ingestion
+ZONE_PREDICTIONS_POLL = float(os.getenv('ZONE_PREDICTIONS_POLL_SECONDS', '2'))
+
+zone_predictions_watcher: Optional[asyncio.Task] = None
+
+# Bearer token for the /models mutations; while unset they are not available
+MODEL_ADMIN_TOKEN = os.getenv('MODEL_ADMIN_TOKEN')
+
+# Models can only be loaded from files under this directory
+MODEL_DIR = os.getenv('MODEL_DIR', 'models')
+
+# Real-time sentiment consumer, started when SENTIMENT_STREAM_ENABLED is set
+sentiment_stream: Optional[SentimentStreamSource] = None
+
+@app.on_event("startup")
+def start_sentiment_stream():
+    global sentiment_stream
+    if os.getenv('SENTIMENT_STREAM_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+        return
+    try:
+        config = load_config()['alternative_data']
+        stream_config = config['datasets']['sentiment']['stream']
+        if predictor.feature_store is None:
+            predictor.feature_store = FeatureStore()
+        sentiment_stream = SentimentStreamSource(config, feed_from_config(stream_config), predictor.feature_store)
+        sentiment_stream.start()
+        print(f"Sentiment stream consumer started ({stream_config.get('type', 'file')})")
+    except Exception as e:
+        print(f"Warning: Could not start sentiment stream: {str(e)}")
+        sentiment_stream = None
+
+@app.on_event("shutdown")
+def stop_sentiment_stream():
+    if sentiment_stream is not None:
+        sentiment_stream.stop()
+
+async def _watch_current_predictions():
+    while True:
+        await asyncio.sleep(ZONE_PREDICTIONS_POLL)
+        try:
+            await run_in_threadpool(predictor.refresh_zone_updates)
+        except Exception as e:
+            print(f"Error checking current predictions for zone updates: {str(e)}")
+        try:
+            await run_in_threadpool(predictor.refresh_features)
+        except Exception as e:
+            print(f"Error refreshing the feature store: {str(e)}")
+
+@app.on_event("startup")
+async def start_zone_predictions_watcher():
+    global zone_predictions_watcher
+    zone_predictions_watcher = asyncio.create_task(_watch_current_predictions())
+
+@app.on_event("shutdown")
+async def stop_zone_predictions_watcher():
+    if zone_predictions_watcher is not None:
+        zone_predictions_watcher.cancel()
+
+async def cached_json_response(request: Request, endpoint: str, body: Any, produce,
+                               cacheable: Optional[Callable[[Any], bool]] = None,
+                               on_hit: Optional[Callable[[bytes], None]] = None) -> Response:
+    """Serve ``produce()`` through the response cache with ETag / If-None-Match support.
+
+    Results rejected by ``cacheable`` are served uncached with ``Cache-Control: no-store``.
+    ``on_hit`` runs with the cached body after a hit (or 304) has been sent, for side
+    effects that every request should have.
+    """
+    state = predictor.state_token()
+    key = response_cache.key(endpoint, body, state)
+    cached = response_cache.get(key, state)
+    background = None
+    if cached is None:
+        payload = jsonable_encoder(await produce())
+        content = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        if cacheable is not None and not cacheable(payload):
+            return Response(content=content, media_type='application/json',
+                            headers={'X-Cache': 'BYPASS', 'Cache-Control': 'no-store'})
+        etag = response_cache.put(key, state, content)
+        cache_status = 'MISS'
+    else:
+        content, etag = cached
+        cache_status = 'HIT'
+        if on_hit is not None:
+            background = BackgroundTask(on_hit, content)
+
+    headers = {'ETag': etag, 'X-Cache': cache_status}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        response_cache.record_not_modified()
+        return Response(status_code=304, headers=headers, background=background)
+    return Response(content=content, media_type='application/json', headers=headers, background=background)
+
 class ZoneData(BaseModel):
     postcode: str
     growth_rate: float
@@ -68,6 +178,7 @@ class PredictionResponse(BaseModel):
     postcode: str
     predicted_score: Optional[float]
     color: str
+    model_version: Optional[str]
     metrics: Metrics
 
     class Config:
@@ -82,9 +193,87 @@ class ZoneSummary(BaseModel):
     class Config:
         orm_mode = True
 
+class Perturbation(BaseModel):
+    feature: str
+    values: List[float]
+    mode: str = "add"
+
+class ScenarioRequest(BaseModel):
+    base: Optional[List[Dict[str, Any]]] = None
+    perturbations: List[Perturbation]
+    max_rows_per_batch: int = 100000
+
+class ScenarioResponse(BaseModel):
+    postcodes: List[str]
+    baseline_scores: List[float]
+    scenarios: List[Dict[str, float]]
+    scores: List[List[float]]
+    color_transitions: List[Dict[str, int]]
+
+MAX_SCENARIOS = 10000
+# Scenario x zone scores in one response; bounds the (S, N) score array and its JSON
+MAX_SCENARIO_CELLS = 2000000
+
+def require_model_admin(authorization: Optional[str] = Header(None)):
+    if not MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorization or not hmac.compare_digest(authorization.encode(), f"Bearer {MODEL_ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid model admin token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+def _model_file(model_path: str) -> str:
+    """``model_path`` if it and the file load_model reads for it are under MODEL_DIR."""
+    root = os.path.realpath(MODEL_DIR)
+    paths = [os.path.realpath(model_path), os.path.realpath(resolve_model_path(model_path))]
+    if any(os.path.commonpath([root, path]) != root for path in paths) or not os.path.isfile(paths[1]):
+        raise HTTPException(status_code=400, detail=f"model_path must be an existing file under {MODEL_DIR}/")
+    return model_path
+
+class ShadowConfig(BaseModel):
+    model_path: str
+    sample_rate: float = 0.1
+
+class RoutingVariant(BaseModel):
+    name: str
+    model_path: str
+    weight: float = 1.0
+
+class RoutingConfig(BaseModel):
+    variants: List[RoutingVariant]
+
+class LiveModelConfig(BaseModel):
+    model_path: str
+
 @app.post("/predict")
-async def predict(data: List[Dict[str, Any]]):
+async def predict(data: List[Dict[str, Any]], request: Request):
     """Make predictions for the given data."""
+    # Requests that leave features to the store are keyed on those postcodes' store revisions
+    key_body = [data, predictor.feature_revisions(data)]
+    return await cached_json_response(
+        request, 'predict', key_body, lambda: _predict(data),
+        cacheable=_cacheable_predictions,
+        on_hit=lambda content: predictor.record_cached_prediction(pd.DataFrame(data), json.loads(content))
+    )
+
+def _cacheable_predictions(payload) -> bool:
+    """Whether a /predict response is stable enough to cache.
+
+    Rule-based insights are only a fallback when an OpenAI client is configured
+    (the call failed), and error-handler insights or a missing score always
+    mean something failed; those responses are recomputed on the next request.
+    """
+    for prediction in payload if isinstance(payload, list) else [payload]:
+        if prediction.get('predicted_score') is None:
+            return False
+        insights = (prediction.get('metrics') or {}).get('ai_insights') or {}
+        generated_by = insights.get('generated_by')
+        if generated_by == 'error-handler':
+            return False
+        if generated_by == 'rule-based' and predictor.openai_client is not None:
+            return False
+    return True
+
+async def _predict(data: List[Dict[str, Any]]):
     try:
         # Convert input data to DataFrame
         df = pd.DataFrame(data)
@@ -93,7 +282,10 @@ async def predict(data: List[Dict[str, Any]]):
             'sentiment', 'interest_rate', 'wages', 'housing_supply_encoded',
             'immigration_encoded'
         ]
-        
+        if sentiment_stream is not None:
+            # Omitted (or null) sentiment is filled from the live stream
+            required_columns.remove('sentiment')
+
         # Validate input data
         missing_columns = [col for col in required_columns if col not in df.columns]
         if missing_columns:
@@ -117,13 +309,91 @@ async def predict(data: List[Dict[str, Any]]):
             detail=f"Error processing prediction request: {str(e)}"
         )
 
+@app.post("/scenarios", response_model=ScenarioResponse)
+async def scenarios(request: ScenarioRequest):
+    """
+    Score every zone under a grid of feature perturbations.
+
+    Without a ``base`` the zones in the current predictions are used.
+    ``scores`` is indexed [scenario][zone].
+    """
+    if request.base:
+        base = pd.DataFrame(request.base)
+    else:
+        try:
+            base = pd.read_csv(
+                os.path.join(predictor.predictions_dir, 'current_predictions.csv'),
+                dtype={'postcode': str}
+            )
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="No base zones given and no current predictions found")
+
+    n_scenarios = 1
+    for perturbation in request.perturbations:
+        n_scenarios *= len(perturbation.values)
+    if n_scenarios > MAX_SCENARIOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Scenario grid has {n_scenarios} scenarios, the maximum is {MAX_SCENARIOS}"
+        )
+    if n_scenarios * len(base) > MAX_SCENARIO_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{n_scenarios} scenarios x {len(base)} zones is {n_scenarios * len(base)} scores, "
+                   f"the maximum is {MAX_SCENARIO_CELLS}; split the zones or the grid across requests"
+        )
+
+    try:
+        # Model calls are CPU-bound; keep them off the event loop
+        return await run_in_threadpool(
+            evaluate_scenarios,
+            predictor.model,
+            base,
+            [p.dict() for p in request.perturbations],
+            request.max_rows_per_batch
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/zones/{postcode}/explain")
+async def explain_zone(postcode: str):
+    """
+    Per-feature contributions to a zone's predicted score.
+
+    Contributions plus ``bias`` sum to ``predicted_score``.
+    """
+    zone = predictor.get_zone_features(postcode)
+    if zone is None:
+        raise HTTPException(status_code=404, detail=f"No features found for postcode {postcode}")
+
+    df = pd.DataFrame([zone])
+    contributions = predictor.explain(df)
+    if contributions is None:
+        raise HTTPException(status_code=501, detail="Loaded model does not support feature contributions")
+
+    contribution = contributions[0]
+    return {
+        "postcode": postcode,
+        "model_version": predictor.model_version,
+        "predicted_score": round(sum(contribution.values()), 4),
+        "bias": contribution["bias"],
+        "contributions": dict(sorted(
+            ((name, value) for name, value in contribution.items() if name != "bias"),
+            key=lambda item: abs(item[1]),
+            reverse=True
+        ))
+    }
+
 @app.get("/summary", response_model=ZoneSummary)
-async def get_summary():
+async def get_summary(request: Request):
     """
     Get a summary of current zone predictions
     """
+    return await cached_json_response(request, 'summary', None, _summary)
+
+async def _summary():
     try:
-        return predictor.get_zone_summary()
+        return ZoneSummary(**predictor.get_zone_summary())
     except Exception as e:
         print(f"Error in get_summary: {str(e)}")
         # Return default summary
@@ -134,6 +404,131 @@ async def get_summary():
             "timestamp": datetime.now().isoformat()
         }
 
+@app.get("/monitoring/drift")
+async def drift_report(reset: bool = False):
+    """
+    Drift of live /predict inputs against the model's training profile.
+    Pass ``reset=true`` to start a new observation window after reading.
+    """
+    if predictor.drift_monitor is None:
+        raise HTTPException(status_code=404, detail="No reference profile found for the loaded model")
+    report = predictor.drift_monitor.report()
+    if reset:
+        predictor.drift_monitor.reset()
+    return report
+
+@app.get("/models")
+async def get_models():
+    """Live model, A/B routing and shadow scoring status."""
+    return {
+        "model_path": predictor.model_path,
+        "model_version": predictor.model_version,
+        "routing": predictor.router.describe() if predictor.router else None,
+        "shadow": predictor.shadow.stats() if predictor.shadow else None
+    }
+
+@app.put("/models/shadow", dependencies=[Depends(require_model_admin)])
+async def set_shadow(config: ShadowConfig):
+    """Shadow-score a sample of live batches with a candidate model."""
+    model_path = _model_file(config.model_path)
+    try:
+        await run_in_threadpool(predictor.configure_shadow, model_path, config.sample_rate)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not configure shadow model: {str(e)}")
+    return predictor.shadow.stats()
+
+@app.delete("/models/shadow", dependencies=[Depends(require_model_admin)])
+async def delete_shadow():
+    predictor.disable_shadow()
+    return {"shadow": None}
+
+@app.put("/models/routing", dependencies=[Depends(require_model_admin)])
+async def set_routing(config: RoutingConfig):
+    """Route /predict batches between model versions by weight."""
+    variants = [dict(v.dict(), model_path=_model_file(v.model_path)) for v in config.variants]
+    try:
+        await run_in_threadpool(predictor.configure_routing, variants)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not configure routing: {str(e)}")
+    return {"routing": predictor.router.describe()}
+
+@app.delete("/models/routing", dependencies=[Depends(require_model_admin)])
+async def delete_routing():
+    await run_in_threadpool(predictor.clear_routing)
+    return {"routing": None}
+
+@app.put("/models/live", dependencies=[Depends(require_model_admin)])
+async def set_live_model(config: LiveModelConfig):
+    """Swap the live model; zones whose score changes are pushed to /zones/updates."""
+    model_path = _model_file(config.model_path)
+    try:
+        await run_in_threadpool(predictor.reload_model, model_path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not load model: {str(e)}")
+    return {"model_path": predictor.model_path, "model_version": predictor.model_version}
+
+@app.get("/zones/updates")
+async def zone_updates(postcodes: Optional[str] = None, bbox: Optional[str] = None,
+                       snapshot: bool = False):
+    """
+    Server-sent events with the zones whose score, colour or model version changed.
+    Filter with ``postcodes=2000,2026`` and/or ``bbox=min_lon,min_lat,max_lon,max_lat``;
+    with neither, every zone is sent. ``snapshot=true`` first sends the current state.
+    """
+    hub = predictor.zone_updates
+    watched = None
+    if postcodes:
+        watched = {postcode.strip() for postcode in postcodes.split(',') if postcode.strip()}
+    if bbox:
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox.split(','))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+        try:
+            in_box = await run_in_threadpool(hub.postcodes_in_bbox, min_lon, min_lat, max_lon, max_lat)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Zone boundaries unavailable: {str(e)}")
+        watched = (watched or set()) | in_box
+
+    async def stream():
+        # Subscribe only once streaming starts, so a client gone before then leaves nothing behind
+        subscription = hub.subscribe(watched)
+        try:
+            yield format_event('ready', {
+                'model_version': predictor.model_version,
+                'sequence': hub.sequence,
+                'postcodes': len(watched) if watched is not None else None
+            })
+            if snapshot:
+                yield format_event('zones', {'reason': 'snapshot', 'zones': hub.snapshot(watched)}, hub.sequence)
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), ZONE_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/streams/zones")
+async def zone_stream_stats():
+    """Zone update subscribers and delivery counts."""
+    return predictor.zone_updates.stats()
+
+@app.get("/streams/sentiment")
+async def sentiment_stream_stats():
+    """Sentiment stream consumer throughput and publish lag."""
+    if sentiment_stream is None:
+        raise HTTPException(status_code=404, detail="Sentiment stream is not enabled")
+    return sentiment_stream.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Response cache size and hit ratio."""
+    return response_cache.stats()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -0,0 +1,174 @@
+"""
+Offline bulk scoring for large CSV/Parquet inputs.
+
+Usage:
+    python -m src.ml.batch_score input.parquet output_dir/ --workers 4 --insights
+
+The input is read in chunks and each chunk is scored in a worker process with a
+single vectorised model call. Every chunk is written as its own
+``part-<n>.parquet`` file, so an interrupted run picks up where it stopped when
+re-run with the same arguments.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .predict import (FEATURE_COLUMNS, PredictionService, compute_model_version, load_model,
+                      score_features, score_to_color)
+
+JOB_FILE = '_job.json'
+
+# Per-process state, populated by _init_worker
+_worker_model = None
+_worker_insights = False
+
+def iter_chunks(input_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Yield the input as DataFrames of ``chunk_size`` rows."""
+    if input_path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(input_path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif input_path.endswith('.csv'):
+        yield from pd.read_csv(input_path, chunksize=chunk_size, dtype={'postcode': str})
+    else:
+        raise ValueError(f"Unsupported input format: {input_path} (expected .csv or .parquet)")
+
+def part_path(output_dir: str, chunk_index: int) -> str:
+    return os.path.join(output_dir, f'part-{chunk_index:05d}.parquet')
+
+def _init_worker(model_path: str, nthread: int, insights: bool):
+    """Load the model once per worker process."""
+    global _worker_model, _worker_insights
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(nthread)
+    _worker_model = load_model(model_path)
+    if hasattr(_worker_model, 'set_params'):
+        _worker_model.set_params(n_jobs=nthread)
+    _worker_insights = insights
+
+def score_chunk(chunk_index: int, df: pd.DataFrame, output_dir: str) -> Tuple[int, int, float]:
+    """Score one chunk and write it as a part file. Runs inside a worker."""
+    start = time.perf_counter()
+    scores = score_features(_worker_model, df)
+    df = df.copy()
+    df['predicted_score'] = scores.astype(np.float32)
+    df['color'] = score_to_color(scores)
+    if _worker_insights:
+        # Only the rule-based generator is used; batch jobs never call OpenAI
+        records = df[[col for col in FEATURE_COLUMNS if col in df.columns]].to_dict('records')
+        df['ai_insights'] = [
+            json.dumps(PredictionService._generate_rule_based_insights(record)) for record in records
+        ]
+
+    # Write to a temporary name first so a killed worker never leaves a partial part
+    final_path = part_path(output_dir, chunk_index)
+    tmp_path = final_path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, final_path)
+    return chunk_index, len(df), time.perf_counter() - start
+
+def _check_job(output_dir: str, job: dict):
+    """Refuse to resume into an output directory written with different settings, model or input."""
+    job_path = os.path.join(output_dir, JOB_FILE)
+    if os.path.exists(job_path):
+        with open(job_path) as f:
+            previous = json.load(f)
+        if previous != job:
+            raise ValueError(
+                f"{output_dir} was written by a different job ({previous}); "
+                "use a new output directory, or the same arguments, model and input"
+            )
+    else:
+        with open(job_path, 'w') as f:
+            json.dump(job, f, indent=2)
+
+def batch_score(input_path: str, output_dir: str, model_path: str = 'models/zone_predictor.joblib',
+                chunk_size: int = 100000, workers: Optional[int] = None,
+                insights: bool = False) -> dict:
+    """Score ``input_path`` into part files under ``output_dir``, skipping finished chunks."""
+    os.makedirs(output_dir, exist_ok=True)
+    input_stat = os.stat(input_path)
+    _check_job(output_dir, {
+        'input_path': os.path.abspath(input_path),
+        'input_signature': f"{input_stat.st_mtime_ns}:{input_stat.st_size}",
+        'model_path': model_path,
+        # A model retrained in place keeps its path but not its version
+        'model_version': compute_model_version(model_path),
+        'chunk_size': chunk_size,
+        'insights': insights
+    })
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    nthread = max(1, (os.cpu_count() or 1) // workers)
+    max_pending = workers * 2
+
+    start = time.perf_counter()
+    rows_done = rows_skipped = 0
+    chunks_done = chunks_skipped = 0
+    pending = set()
+
+    def drain(return_when):
+        nonlocal rows_done, chunks_done, pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            _, rows, _ = future.result()
+            rows_done += rows
+            chunks_done += 1
+        elapsed = time.perf_counter() - start
+        rate = rows_done / elapsed if elapsed > 0 else 0.0
+        print(f"\r{chunks_done} chunk(s), {rows_done:,} rows scored, {rate:,.0f} rows/s",
+              end='', file=sys.stderr, flush=True)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_path, nthread, insights)) as executor:
+        for chunk_index, df in enumerate(iter_chunks(input_path, chunk_size)):
+            if os.path.exists(part_path(output_dir, chunk_index)):
+                rows_skipped += len(df)
+                chunks_skipped += 1
+                continue
+            # Bound the number of chunks held in memory
+            while len(pending) >= max_pending:
+                drain(FIRST_COMPLETED)
+            pending.add(executor.submit(score_chunk, chunk_index, df, output_dir))
+        if pending:
+            drain(ALL_COMPLETED)
+    print(file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'rows_scored': rows_done,
+        'rows_skipped': rows_skipped,
+        'chunks_scored': chunks_done,
+        'chunks_skipped': chunks_skipped,
+        'seconds': elapsed,
+        'rows_per_second': rows_done / elapsed if elapsed > 0 else 0.0
+    }
+    print(f"Scored {rows_done:,} rows in {elapsed:.1f}s ({stats['rows_per_second']:,.0f} rows/s); "
+          f"skipped {chunks_skipped} finished chunk(s)")
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score large CSV/Parquet files offline")
+    parser.add_argument('input', help="Input .csv or .parquet file")
+    parser.add_argument('output_dir', help="Directory for part-*.parquet output files")
+    parser.add_argument('--model', default='models/zone_predictor.joblib', help="Model path")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="Rows per chunk")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--insights', action='store_true', help="Add rule-based insights per row")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    batch_score(args.input, args.output_dir, model_path=args.model, chunk_size=args.chunk_size,
+                workers=args.workers, insights=args.insights)
+
+if __name__ == "__main__":
+    main()
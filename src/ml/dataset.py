@@ -0,0 +1,172 @@
+import glob
+import os
+import re
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+from .drift import ReservoirSample
+from .train import FEATURES_DIR, ZonePredictor
+
+# Raw categorical columns that ZonePredictor.prepare_data encodes into features
+ENCODED_SOURCES = ['housing_supply', 'immigration']
+
+_SNAPSHOT_PATTERN = re.compile(r'processed_data_(\d{8}_\d{6})\.parquet$')
+
+def snapshot_time(path: str) -> Optional[datetime]:
+    """Parse the run timestamp from a processed_data_<ts>.parquet file name."""
+    match = _SNAPSHOT_PATTERN.search(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')
+
+class ParquetFeatureDataset:
+    """Streams processed feature snapshots row group by row group.
+
+    Only the columns needed for training are read, and snapshots outside
+    ``[start, end)`` are skipped by file name before any I/O happens. When a
+    ``time_column`` is given, row groups whose min/max statistics fall outside
+    the range are skipped too and the remaining rows are filtered exactly.
+    """
+
+    def __init__(self, features_dir: str = FEATURES_DIR, features: Optional[List[str]] = None,
+                 target: str = 'risk_score', start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, time_column: Optional[str] = None,
+                 batch_size: int = 65536):
+        self.features_dir = features_dir
+        self.features = features or ZonePredictor().features
+        self.target = target
+        self.start = start
+        self.end = end
+        self.time_column = time_column
+        self.batch_size = batch_size
+        self.paths = self._select_files()
+
+    def _select_files(self) -> List[str]:
+        paths = sorted(glob.glob(os.path.join(self.features_dir, 'processed_data_*.parquet')))
+        selected = []
+        for path in paths:
+            ts = snapshot_time(path)
+            if ts is not None and self.time_column is None:
+                if self.start and ts < self.start:
+                    continue
+                if self.end and ts >= self.end:
+                    continue
+            selected.append(path)
+        return selected
+
+    def _columns_for(self, schema_names: List[str]) -> List[str]:
+        wanted = self.features + ENCODED_SOURCES + [self.target]
+        if self.time_column:
+            wanted.append(self.time_column)
+        return [col for col in dict.fromkeys(wanted) if col in schema_names]
+
+    def _row_group_in_range(self, metadata, row_group: int, column_index: int) -> bool:
+        stats = metadata.row_group(row_group).column(column_index).statistics
+        if stats is None or not stats.has_min_max:
+            return True
+        lo, hi = pd.Timestamp(stats.min), pd.Timestamp(stats.max)
+        if self.start and hi < pd.Timestamp(self.start):
+            return False
+        if self.end and lo >= pd.Timestamp(self.end):
+            return False
+        return True
+
+    def _filter_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        times = pd.to_datetime(df[self.time_column])
+        mask = np.ones(len(df), dtype=bool)
+        if self.start:
+            mask &= (times >= pd.Timestamp(self.start)).to_numpy()
+        if self.end:
+            mask &= (times < pd.Timestamp(self.end)).to_numpy()
+        return df[mask]
+
+    def iter_frames(self) -> Iterator[pd.DataFrame]:
+        """Yield prepared pandas frames of at most ``batch_size`` rows."""
+        predictor = ZonePredictor()
+        for path in self.paths:
+            parquet_file = pq.ParquetFile(path)
+            schema_names = parquet_file.schema_arrow.names
+            columns = self._columns_for(schema_names)
+            if self.target not in columns:
+                continue
+
+            row_groups = list(range(parquet_file.num_row_groups))
+            if self.time_column and (self.start or self.end):
+                if self.time_column not in schema_names:
+                    continue
+                column_index = parquet_file.schema_arrow.get_field_index(self.time_column)
+                row_groups = [
+                    rg for rg in row_groups
+                    if self._row_group_in_range(parquet_file.metadata, rg, column_index)
+                ]
+            if not row_groups:
+                continue
+
+            for batch in parquet_file.iter_batches(batch_size=self.batch_size,
+                                                   row_groups=row_groups, columns=columns):
+                df = batch.to_pandas()
+                if self.time_column in df.columns and (self.start or self.end):
+                    df = self._filter_rows(df)
+                df = predictor.prepare_data(df)
+                df = df.dropna(subset=[self.target])
+                if df.empty:
+                    continue
+                for feature in self.features:
+                    if feature not in df.columns:
+                        df[feature] = np.nan
+                yield df
+
+    def iter_batches(self) -> Iterator[tuple]:
+        """Yield ``(X, y)`` float32 arrays per batch."""
+        for df in self.iter_frames():
+            yield (df[self.features].to_numpy(dtype=np.float32),
+                   df[self.target].to_numpy(dtype=np.float32))
+
+    def to_dmatrix(self, external_memory: bool = True, cache_dir: str = os.path.join('data', 'cache', 'xgb'),
+                   max_bin: int = 256, nthread: Optional[int] = None,
+                   sample: Optional[ReservoirSample] = None):
+        """Build a DMatrix without materialising the full history in memory.
+
+        With ``external_memory`` the pages are spilled to ``cache_dir`` and
+        streamed back during training. Otherwise a ``QuantileDMatrix`` is built
+        from the iterator, which keeps only the quantised histogram in memory.
+        If ``sample`` is given, it receives every feature row of the first pass.
+        """
+        if external_memory:
+            os.makedirs(cache_dir, exist_ok=True)
+            iterator = FeatureBatchIter(self, cache_prefix=os.path.join(cache_dir, 'features'), sample=sample)
+            return xgb.DMatrix(iterator, nthread=nthread)
+        iterator = FeatureBatchIter(self, sample=sample)
+        return xgb.QuantileDMatrix(iterator, max_bin=max_bin, nthread=nthread)
+
+class FeatureBatchIter(xgb.DataIter):
+    """Adapts a ParquetFeatureDataset to XGBoost's iterator-based DMatrix API."""
+
+    def __init__(self, dataset: ParquetFeatureDataset, cache_prefix: Optional[str] = None,
+                 sample: Optional[ReservoirSample] = None):
+        self.dataset = dataset
+        self.sample = sample
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> bool:
+        if self._batches is None:
+            self._batches = self.dataset.iter_batches()
+        try:
+            X, y = next(self._batches)
+        except StopIteration:
+            # XGBoost may make several passes; sample only the first
+            self.sample = None
+            return False
+        if self.sample is not None:
+            self.sample.add(X)
+        input_data(data=X, label=y)
+        return True
+
+    def reset(self):
+        self._batches = None
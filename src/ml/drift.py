@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Quantiles of the training data used as histogram bin edges
+REFERENCE_QUANTILES = np.linspace(0.1, 0.9, 9)
+
+# PSI above this is conventionally treated as a significant shift
+PSI_ALERT_THRESHOLD = 0.25
+
+_EPSILON = 1e-6
+
+def profile_path_for(model_path: str) -> str:
+    """Reference profile location next to the model file."""
+    base = model_path[:-len('.joblib')] if model_path.endswith('.joblib') else os.path.splitext(model_path)[0]
+    return base + '.profile.json'
+
+class ReferenceProfile:
+    """Per-feature training distribution summary saved alongside a model."""
+
+    def __init__(self, features: List[str], edges: np.ndarray, fractions: np.ndarray,
+                 mean: np.ndarray, std: np.ndarray, minimum: np.ndarray, maximum: np.ndarray,
+                 n_rows: int):
+        self.features = list(features)
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.fractions = np.asarray(fractions, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.minimum = np.asarray(minimum, dtype=np.float64)
+        self.maximum = np.asarray(maximum, dtype=np.float64)
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_matrix(cls, features: List[str], X: np.ndarray) -> 'ReferenceProfile':
+        X = np.asarray(X, dtype=np.float64)
+        edges = np.nanquantile(X, REFERENCE_QUANTILES, axis=0).T
+        fractions = np.stack([
+            _bin_counts(X[:, i], edges[i]) for i in range(X.shape[1])
+        ]).astype(np.float64)
+        fractions /= np.maximum(fractions.sum(axis=1, keepdims=True), 1)
+        return cls(features, edges, fractions, np.nanmean(X, axis=0), np.nanstd(X, axis=0),
+                   np.nanmin(X, axis=0), np.nanmax(X, axis=0), len(X))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'created': datetime.now().isoformat(),
+                'features': self.features,
+                'edges': self.edges.tolist(),
+                'fractions': self.fractions.tolist(),
+                'mean': self.mean.tolist(),
+                'std': self.std.tolist(),
+                'min': self.minimum.tolist(),
+                'max': self.maximum.tolist(),
+                'n_rows': self.n_rows
+            }, f, indent=2)
+        print(f"Reference profile saved to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> 'ReferenceProfile':
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['features'], data['edges'], data['fractions'], data['mean'], data['std'],
+                   data['min'], data['max'], data['n_rows'])
+
+class ReservoirSample:
+    """Uniform sample of at most ``capacity`` rows from a stream of batches (Algorithm R)."""
+
+    def __init__(self, capacity: int, seed: int = 42):
+        self.capacity = capacity
+        self.seen = 0
+        self._rows: Optional[np.ndarray] = None
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, X: np.ndarray):
+        X = np.asarray(X)
+        if len(X) == 0:
+            return
+        if self._rows is None:
+            self._rows = np.empty((self.capacity, X.shape[1]), dtype=X.dtype)
+        # Row t of the stream replaces a uniformly drawn slot in [0, t] if that slot is kept
+        positions = self.seen + np.arange(len(X))
+        slots = np.where(positions < self.capacity, positions,
+                         np.floor(self._rng.random(len(X)) * (positions + 1)).astype(np.int64))
+        keep = slots < self.capacity
+        self._rows[slots[keep]] = X[keep]
+        self.seen += len(X)
+
+    def sample(self) -> np.ndarray:
+        if self._rows is None:
+            return np.empty((0, 0))
+        return self._rows[:min(self.seen, self.capacity)]
+
+def _bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Counts of non-NaN ``values`` in the len(edges) + 1 bins delimited by ``edges``."""
+    values = values[~np.isnan(values)]
+    return np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+
+class DriftMonitor:
+    """Streaming, fixed-size per-feature sketches of live inputs.
+
+    Each update adds a batch to per-feature histograms over the reference bin
+    edges plus running sums, so memory does not grow with traffic and an
+    update is a handful of vectorised numpy calls.
+    """
+
+    def __init__(self, profile: ReferenceProfile):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        n_features = len(self.profile.features)
+        self._counts = np.zeros((n_features, self.profile.edges.shape[1] + 1), dtype=np.int64)
+        self._n = 0
+        self._sum = np.zeros(n_features)
+        self._sum_sq = np.zeros(n_features)
+        self._filled = np.zeros(n_features, dtype=np.int64)
+        self._out_of_range = np.zeros(n_features, dtype=np.int64)
+        self._min = np.full(n_features, np.inf)
+        self._max = np.full(n_features, -np.inf)
+        self.started = datetime.now().isoformat()
+
+    def update(self, X: np.ndarray, filled: Optional[np.ndarray] = None):
+        """Add a batch of model inputs; ``filled`` marks values that were default-filled."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.size == 0:
+            return
+        # Bin index = number of edges <= value, for every feature at once; then
+        # offset each feature into its own block so one bincount covers them all
+        n_bins = self._counts.shape[1]
+        bins = (X[:, :, np.newaxis] >= self.profile.edges[np.newaxis, :, :]).sum(axis=2)
+        flat = (bins + np.arange(X.shape[1]) * n_bins).ravel()
+        counts = np.bincount(flat, minlength=self._counts.size).reshape(self._counts.shape)
+        out_of_range = ((X < self.profile.minimum) | (X > self.profile.maximum)).sum(axis=0)
+
+        with self._lock:
+            self._counts += counts
+            self._n += len(X)
+            self._sum += X.sum(axis=0)
+            self._sum_sq += np.square(X).sum(axis=0)
+            self._out_of_range += out_of_range
+            self._min = np.minimum(self._min, X.min(axis=0))
+            self._max = np.maximum(self._max, X.max(axis=0))
+            if filled is not None:
+                self._filled += np.asarray(filled, dtype=bool).sum(axis=0)
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def report(self) -> Dict[str, Any]:
+        """Drift scores per feature against the reference profile."""
+        with self._lock:
+            n = self._n
+            counts = self._counts.copy()
+            sums, sums_sq = self._sum.copy(), self._sum_sq.copy()
+            filled, out_of_range = self._filled.copy(), self._out_of_range.copy()
+            minimum, maximum = self._min.copy(), self._max.copy()
+
+        features = {}
+        if n:
+            live = counts / n
+            ref = self.profile.fractions
+            psi = np.sum((live - ref) * np.log((live + _EPSILON) / (ref + _EPSILON)), axis=1)
+            mean = sums / n
+            std = np.sqrt(np.maximum(sums_sq / n - np.square(mean), 0))
+            mean_shift = (mean - self.profile.mean) / np.maximum(self.profile.std, _EPSILON)
+            for i, feature in enumerate(self.profile.features):
+                features[feature] = {
+                    'psi': round(float(psi[i]), 4),
+                    'drifted': bool(psi[i] > PSI_ALERT_THRESHOLD),
+                    'mean': float(mean[i]),
+                    'std': float(std[i]),
+                    'min': float(minimum[i]),
+                    'max': float(maximum[i]),
+                    'reference_mean': float(self.profile.mean[i]),
+                    'mean_shift_std': round(float(mean_shift[i]), 4),
+                    'out_of_range_rate': round(float(out_of_range[i] / n), 4),
+                    'default_fill_rate': round(float(filled[i] / n), 4)
+                }
+        return {
+            'rows': n,
+            'since': self.started,
+            'reference_rows': self.profile.n_rows,
+            'psi_alert_threshold': PSI_ALERT_THRESHOLD,
+            'drifted_features': [name for name, stats in features.items() if stats['drifted']],
+            'features': features
+        }
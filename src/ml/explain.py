@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+class ContributionExplainer:
+    """Per-feature score contributions from XGBoost's ``pred_contribs`` output.
+
+    Contributions are computed for a whole batch in one booster call and
+    cached per (model version, feature-row hash), so re-explaining the same
+    zones under the same model is a dictionary lookup. The cache is an LRU
+    bounded to ``max_entries`` rows.
+    """
+
+    def __init__(self, feature_names: List[str], max_entries: int = 100000):
+        self.feature_names = list(feature_names)
+        self.max_entries = max_entries
+        self._cache: 'OrderedDict[tuple, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def supports(model) -> bool:
+        return hasattr(model, 'get_booster')
+
+    @staticmethod
+    def _row_key(model_version: str, row: np.ndarray) -> tuple:
+        return model_version, hashlib.blake2b(row.tobytes(), digest_size=16).digest()
+
+    def contributions(self, model, model_version: str, X: np.ndarray) -> np.ndarray:
+        """Return an (N, F + 1) array: one column per feature plus the bias last."""
+        import xgboost as xgb
+
+        if not self.supports(model):
+            raise ValueError("Model does not support feature contributions")
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        keys = [self._row_key(model_version, row) for row in X]
+        result = np.empty((len(X), X.shape[1] + 1), dtype=np.float32)
+
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    result[i] = cached
+            self.hits += len(X) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            dmatrix = xgb.DMatrix(X[missing])
+            computed = model.get_booster().predict(dmatrix, pred_contribs=True, validate_features=False)
+            result[missing] = computed
+            with self._lock:
+                for i, row in zip(missing, computed):
+                    self._cache[keys[i]] = row
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return result
+
+    def explain(self, model, model_version: str, X: np.ndarray) -> List[Dict[str, float]]:
+        """Contributions as ``{feature: value, ..., 'bias': value}`` dicts, one per row."""
+        contribs = self.contributions(model, model_version, X)
+        names = self.feature_names + ['bias']
+        return [
+            {name: round(float(value), 4) for name, value in zip(names, row)}
+            for row in contribs
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+def top_drivers(contributions: Optional[Dict[str, float]], n: int = 3) -> List[tuple]:
+    """The ``n`` features with the largest absolute contribution, largest first."""
+    if not contributions:
+        return []
+    features = [(name, value) for name, value in contributions.items() if name != 'bias']
+    return sorted(features, key=lambda item: abs(item[1]), reverse=True)[:n]
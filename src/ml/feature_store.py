@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR = os.path.join('data', 'processed', 'feature_store')
+
+KEY_COLUMNS = ['postcode', 'as_of']
+
+# Part metadata listing every postcode in the upsert that wrote it, changed or not
+COVERED_POSTCODES_KEY = b'feature_store.covered_postcodes'
+
+class FeatureStore:
+    """Feature tables keyed by (postcode, as_of), one table per source.
+
+    Each source is stored as append-only parts under ``<root>/<source>/``
+    with a categorical postcode, a datetime ``as_of`` and float32 metrics.
+    ``upsert`` writes a new part holding only the rows whose values differ
+    from the latest stored row for that postcode, and never rewrites earlier
+    parts. Only the latest row per postcode and source is kept in memory; the
+    full history is read from disk when ``history`` or ``point_in_time_join``
+    needs it. ``refresh`` picks up parts written by other processes.
+    """
+
+    def __init__(self, root: str = FEATURE_STORE_DIR):
+        self.root = root
+        # source -> latest stored row per postcode
+        self._latest_rows: Dict[str, pd.DataFrame] = {}
+        # postcode -> merged latest features across sources
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        # (source, postcode) -> as_of of the row currently in self._latest
+        self._latest_as_of: Dict[tuple, pd.Timestamp] = {}
+        # (source, postcode) whose latest values came from publish, not a stored row
+        self._published: Set[tuple] = set()
+        # source -> names of the parts already indexed
+        self._parts: Dict[str, Set[str]] = {}
+        self._signature: Optional[tuple] = None
+        # Guards the latest-vector index, which streaming sources update concurrently
+        self._lock = threading.Lock()
+        # Serialises reading and writing parts
+        self._parts_lock = threading.RLock()
+        # Incremented on every change to the latest vectors
+        self.revision = 0
+        # postcode -> revision at which its latest vector last changed
+        self._postcode_revisions: Dict[str, int] = {}
+        self.refresh()
+
+    def _source_dir(self, source: str) -> str:
+        return os.path.join(self.root, source)
+
+    def sources(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(entry.name for entry in os.scandir(self.root) if entry.is_dir())
+
+    def _part_names(self, source: str) -> List[str]:
+        return sorted(name for name in os.listdir(self._source_dir(source)) if name.endswith('.parquet'))
+
+    def _dir_signature(self) -> tuple:
+        """mtime of the root and every source directory, which changes when a part is added."""
+        try:
+            signature = [os.stat(self.root).st_mtime_ns]
+        except FileNotFoundError:
+            return ()
+        for source in self.sources():
+            signature.append((source, os.stat(self._source_dir(source)).st_mtime_ns))
+        return tuple(signature)
+
+    def refresh(self) -> int:
+        """Index parts written since the last refresh, e.g. by an ingestion process.
+
+        Cheap when nothing changed: only the directories are stat'ed. Returns
+        the number of new parts read.
+        """
+        signature = self._dir_signature()
+        if signature == self._signature:
+            return 0
+        read = 0
+        with self._parts_lock:
+            for source in self.sources():
+                known = self._parts.setdefault(source, set())
+                for name in self._part_names(source):
+                    if name in known:
+                        continue
+                    rows, covered = self._read_part(source, name)
+                    known.add(name)
+                    self._apply(source, rows, covered)
+                    read += 1
+            self._signature = signature
+        if read:
+            logger.info(f"Feature store indexed {read} new part(s) from {self.root}")
+        return read
+
+    def _read_part(self, source: str, name: str) -> Tuple[pd.DataFrame, List[str]]:
+        table = pq.read_table(os.path.join(self._source_dir(source), name))
+        metadata = table.schema.metadata or {}
+        covered = json.loads(metadata.get(COVERED_POSTCODES_KEY, b'[]'))
+        return self._compact(table.to_pandas()), covered
+
+    def _write_part(self, source: str, rows: pd.DataFrame, covered: List[str]):
+        """Atomically add a part holding ``rows`` and the postcodes its upsert covered."""
+        directory = self._source_dir(source)
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+        table = pa.Table.from_pandas(rows, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[COVERED_POSTCODES_KEY] = json.dumps(covered).encode('utf-8')
+        tmp_path = os.path.join(directory, name + '.tmp')
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, os.path.join(directory, name))
+        self._parts.setdefault(source, set()).add(name)
+
+    def _apply(self, source: str, rows: pd.DataFrame, covered: List[str]):
+        """Fold a part into the latest rows and vectors.
+
+        Published values for the postcodes the upsert covered are replaced by
+        the stored row, whether or not that row changed.
+        """
+        previous = self._latest_rows.get(source)
+        if not rows.empty:
+            combined = rows if previous is None else pd.concat([previous, rows], ignore_index=True)
+            self._latest_rows[source] = self._compact(
+                combined.sort_values('as_of', kind='stable').drop_duplicates('postcode', keep='last')
+            )
+        with self._lock:
+            published = {postcode for key_source, postcode in self._published if key_source == source}
+        superseded = (published & set(covered)) - set(rows['postcode'].astype(str))
+        stored = self._latest_rows.get(source)
+        if superseded and stored is not None:
+            restored = stored[stored['postcode'].astype(str).isin(superseded)]
+            rows = pd.concat([rows, restored], ignore_index=True) if not rows.empty else restored
+        if not rows.empty:
+            self._index(source, rows)
+
+    @staticmethod
+    def _compact(data: pd.DataFrame) -> pd.DataFrame:
+        """Cast to the store's compact dtypes."""
+        data = data.copy()
+        data['postcode'] = data['postcode'].astype(str).astype('category')
+        data['as_of'] = pd.to_datetime(data['as_of']).astype('datetime64[ns]')
+        for col in data.columns:
+            if col in KEY_COLUMNS:
+                continue
+            if pd.api.types.is_numeric_dtype(data[col]) and not pd.api.types.is_bool_dtype(data[col]):
+                data[col] = data[col].astype(np.float32)
+            elif not isinstance(data[col].dtype, pd.CategoricalDtype):
+                data[col] = data[col].astype(str).astype('category')
+        return data
+
+    def _index(self, source: str, rows: pd.DataFrame):
+        """Refresh the latest-vector index from newly stored rows."""
+        value_columns = [col for col in rows.columns if col not in KEY_COLUMNS]
+        latest_rows = rows.sort_values('as_of', kind='stable').drop_duplicates('postcode', keep='last')
+        with self._lock:
+            self.revision += 1
+            self._index_records(source, latest_rows.to_dict('records'), value_columns)
+
+    def _index_records(self, source: str, records: List[Dict[str, Any]], value_columns: List[str]):
+        for record in records:
+            postcode = str(record['postcode'])
+            key = (source, postcode)
+            # Stored rows always replace streamed values, whatever their as_of
+            if key not in self._published and key in self._latest_as_of and self._latest_as_of[key] > record['as_of']:
+                continue
+            self._published.discard(key)
+            self._latest_as_of[key] = record['as_of']
+            self._postcode_revisions[postcode] = self.revision
+            vector = self._latest.setdefault(postcode, {})
+            for col in value_columns:
+                value = record[col]
+                vector[col] = float(value) if isinstance(value, np.floating) else value
+
+    def history(self, source: str) -> pd.DataFrame:
+        """Every stored row of ``source``, read from its parts."""
+        with self._parts_lock:
+            parts = [self._read_part(source, name)[0] for name in self._part_names(source)]
+        if not parts:
+            return pd.DataFrame(columns=KEY_COLUMNS)
+        # A later upsert of the same (postcode, as_of) replaces the earlier row
+        table = pd.concat(parts, ignore_index=True).drop_duplicates(KEY_COLUMNS, keep='last')
+        return self._compact(table).reset_index(drop=True)
+
+    def upsert(self, source: str, data: pd.DataFrame, as_of: Optional[datetime] = None) -> int:
+        """Store the rows of ``data`` that changed since the latest snapshot.
+
+        ``data`` must have a ``postcode`` column; ``as_of`` is taken from the
+        column of that name, the argument, or today's date in that order.
+        The changed rows are appended as a new part together with the list of
+        postcodes in ``data``, so values ``publish``ed for the same source and
+        postcode are replaced by the stored row, even if it is unchanged, in
+        this and every other process that refreshes. Returns the number of
+        rows written.
+        """
+        if 'postcode' not in data.columns:
+            raise ValueError(f"Source '{source}' is missing required column: postcode")
+        incoming = data.copy()
+        if 'as_of' not in incoming.columns:
+            incoming['as_of'] = pd.Timestamp(as_of or datetime.now()).normalize()
+        incoming = self._compact(incoming).drop_duplicates(KEY_COLUMNS, keep='last')
+        value_columns = [col for col in incoming.columns if col not in KEY_COLUMNS]
+        covered = sorted(incoming['postcode'].astype(str).unique().tolist())
+
+        with self._parts_lock:
+            # Compare against parts other processes have written too
+            self.refresh()
+            latest = self._latest_rows.get(source)
+            if latest is not None and not latest.empty:
+                latest = latest.set_index('postcode')
+                latest.index = latest.index.astype(str)
+                previous = latest.reindex(incoming['postcode'].astype(str))
+                changed = np.zeros(len(incoming), dtype=bool)
+                for col in value_columns:
+                    new = incoming[col].astype(object).to_numpy()
+                    if col not in previous.columns:
+                        changed |= ~pd.isna(new)
+                        continue
+                    old = previous[col].astype(object).to_numpy()
+                    same = (new == old) | (pd.isna(new) & pd.isna(old))
+                    changed |= ~same
+                changed |= previous['as_of'].isna().to_numpy()
+                incoming = incoming[changed]
+
+            incoming = self._compact(incoming.reset_index(drop=True))
+            self._write_part(source, incoming, covered)
+            self._apply(source, incoming, covered)
+        logger.info(f"Upserted {len(incoming)} changed row(s) into feature store source '{source}'")
+        return len(incoming)
+
+    def get_latest(self, postcode: str) -> Optional[Dict[str, Any]]:
+        """Latest feature vector for ``postcode`` across all sources."""
+        with self._lock:
+            vector = self._latest.get(str(postcode))
+            return dict(vector) if vector is not None else None
+
+    def postcode_revision(self, postcode: str) -> int:
+        """Store revision at which ``postcode``'s latest vector last changed, 0 if it has none."""
+        with self._lock:
+            return self._postcode_revisions.get(str(postcode), 0)
+
+    def publish(self, source: str, updates: Dict[str, Dict[str, Any]], as_of: Optional[datetime] = None):
+        """Update latest vectors in memory only, for low-lag streaming sources.
+
+        ``updates`` maps postcode to feature values. Nothing is persisted; the
+        next ``upsert`` of the same source, here or in a process whose parts
+        ``refresh`` picks up, replaces these values for the postcodes it
+        contains, and later publishes replace them again.
+        """
+        as_of = pd.Timestamp(as_of or datetime.now())
+        with self._lock:
+            self.revision += 1
+            for postcode, features in updates.items():
+                postcode = str(postcode)
+                self._latest_as_of[(source, postcode)] = as_of
+                self._published.add((source, postcode))
+                self._postcode_revisions[postcode] = self.revision
+                self._latest.setdefault(postcode, {}).update(features)
+
+    def latest_frame(self, base_source: Optional[str] = None) -> pd.DataFrame:
+        """Latest row per postcode, joined across sources.
+
+        With ``base_source`` only postcodes present in that source are kept,
+        mirroring a left join onto it.
+        """
+        frame = None
+        sources = list(self._latest_rows)
+        if base_source in sources:
+            sources.remove(base_source)
+            sources.insert(0, base_source)
+        for source in sources:
+            latest = self._latest_rows[source].drop(columns=['as_of'])
+            latest['postcode'] = latest['postcode'].astype(str)
+            if frame is None:
+                frame = latest
+            else:
+                how = 'left' if base_source else 'outer'
+                overlap = [col for col in latest.columns if col in frame.columns and col != 'postcode']
+                frame = frame.merge(latest.drop(columns=overlap), on='postcode', how=how)
+        if frame is None:
+            return pd.DataFrame(columns=['postcode'])
+        frame['postcode'] = frame['postcode'].astype('category')
+        return frame.reset_index(drop=True)
+
+    def point_in_time_join(self, entities: pd.DataFrame, sources: Optional[List[str]] = None) -> pd.DataFrame:
+        """Attach to each (postcode, as_of) row the features known at that time.
+
+        Uses a backward as-of join so training rows never see values recorded
+        after their own timestamp.
+        """
+        missing = [col for col in KEY_COLUMNS if col not in entities.columns]
+        if missing:
+            raise ValueError(f"Entities are missing required columns: {', '.join(missing)}")
+        result = entities.copy()
+        result['postcode'] = result['postcode'].astype(str)
+        result['as_of'] = pd.to_datetime(result['as_of']).astype('datetime64[ns]')
+        result = result.reset_index(drop=True)
+        result['_row'] = np.arange(len(result))
+        result = result.sort_values('as_of')
+
+        for source in sources or self.sources():
+            table = self.history(source)
+            table['postcode'] = table['postcode'].astype(str)
+            overlap = [col for col in table.columns if col in result.columns and col not in KEY_COLUMNS]
+            table = table.drop(columns=overlap).sort_values('as_of')
+            result = pd.merge_asof(result, table, on='as_of', by='postcode', direction='backward')
+
+        return result.sort_values('_row').drop(columns=['_row']).reset_index(drop=True)
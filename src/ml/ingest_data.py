@@ -5,10 +5,18 @@ import os
 import yaml
 import requests
 import logging
-from typing import Dict, List, Any, Optional
+import json
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterator
 from abc import ABC, abstractmethod
 from bs4 import BeautifulSoup
 
+from .feature_store import FeatureStore
+from .raw_store import BackgroundCompactor, RawDataLake
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,8 +27,9 @@ logger = logging.getLogger(__name__)
 class DataSource(ABC):
     """Abstract base class for data sources"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], raw_store: Optional[RawDataLake] = None):
         self.config = config
+        self.raw_store = raw_store or RawDataLake()
         self.source_name = config.get('source', 'Unknown')
         self.api_endpoint = config.get('api_endpoint', '')
         self.update_frequency = config.get('update_frequency', 'daily')
@@ -36,14 +45,9 @@ class DataSource(ABC):
         pass
     
     def save_raw_data(self, data: pd.DataFrame, dataset_name: str):
-        """Save raw data to appropriate directory"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{dataset_name}_{timestamp}.parquet"
+        """Save raw data to this source's date partition in the raw data lake"""
         source_type = self.__class__.__name__.lower().replace('source', '')
-        filepath = os.path.join('data', 'raw', source_type, filename)
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        data.to_parquet(filepath, index=False)
-        logger.info(f"Saved raw data to {filepath}")
+        return self.raw_store.write(source_type, dataset_name, data)
 
 class ABSSource(DataSource):
     """Australian Bureau of Statistics data source"""
@@ -147,24 +151,337 @@ class PropertySource(DataSource):
         required_columns = ['postcode', 'median_price', 'growth_rate']
         return all(col in data.columns for col in required_columns)
 
+class WindowedAggregator:
+    """Per-postcode tumbling and sliding window means in bounded memory.
+
+    The sliding window is a ring of ``sliding_seconds / bucket_seconds``
+    (sum, count) buckets per postcode, so memory per postcode is fixed no
+    matter how many events arrive. At most ``max_postcodes`` postcodes are
+    tracked; the least recently updated one is dropped beyond that.
+    """
+
+    def __init__(self, tumbling_seconds: int = 300, sliding_seconds: int = 3600,
+                 bucket_seconds: int = 60, max_postcodes: int = 10000):
+        self.tumbling_seconds = tumbling_seconds
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = max(1, sliding_seconds // bucket_seconds)
+        self.max_postcodes = max_postcodes
+        self._state: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+    def _new_state(self) -> Dict[str, Any]:
+        return {
+            'bucket_ids': np.full(self.n_buckets, -1, dtype=np.int64),
+            'sums': np.zeros(self.n_buckets),
+            'counts': np.zeros(self.n_buckets, dtype=np.int64),
+            'window_id': -1,
+            'window_sum': 0.0,
+            'window_count': 0,
+            'closed_window_mean': None,
+            'last_event': 0.0
+        }
+
+    def add(self, postcode: str, value: float, ts: float):
+        state = self._state.get(postcode)
+        if state is None:
+            state = self._new_state()
+            self._state[postcode] = state
+            if len(self._state) > self.max_postcodes:
+                self._state.popitem(last=False)
+        else:
+            self._state.move_to_end(postcode)
+
+        # Sliding window ring buffer
+        bucket = int(ts // self.bucket_seconds)
+        slot = bucket % self.n_buckets
+        if state['bucket_ids'][slot] != bucket:
+            if state['bucket_ids'][slot] > bucket:
+                return  # Older than the sliding window
+            state['bucket_ids'][slot] = bucket
+            state['sums'][slot] = 0.0
+            state['counts'][slot] = 0
+        state['sums'][slot] += value
+        state['counts'][slot] += 1
+
+        # Tumbling window: close the current one when an event for a later window arrives
+        window = int(ts // self.tumbling_seconds)
+        if window > state['window_id']:
+            if state['window_count']:
+                state['closed_window_mean'] = state['window_sum'] / state['window_count']
+            state['window_id'] = window
+            state['window_sum'] = 0.0
+            state['window_count'] = 0
+        if window == state['window_id']:
+            state['window_sum'] += value
+            state['window_count'] += 1
+        state['last_event'] = max(state['last_event'], ts)
+
+    def sliding_mean(self, postcode: str, now: Optional[float] = None) -> Optional[float]:
+        state = self._state.get(postcode)
+        if state is None:
+            return None
+        current = int((now if now is not None else state['last_event']) // self.bucket_seconds)
+        live = state['bucket_ids'] > current - self.n_buckets
+        count = state['counts'][live].sum()
+        return float(state['sums'][live].sum() / count) if count else None
+
+    def tumbling_mean(self, postcode: str) -> Optional[float]:
+        """Mean of the last closed tumbling window, or the open one if none has closed."""
+        state = self._state.get(postcode)
+        if state is None:
+            return None
+        if state['closed_window_mean'] is not None:
+            return state['closed_window_mean']
+        return state['window_sum'] / state['window_count'] if state['window_count'] else None
+
+    def snapshot(self, now: Optional[float] = None) -> pd.DataFrame:
+        return pd.DataFrame([{
+            'postcode': postcode,
+            'sentiment_score': self.sliding_mean(postcode, now),
+            'sentiment_tumbling': self.tumbling_mean(postcode),
+            'event_count': int(state['counts'].sum()),
+            'last_event': datetime.fromtimestamp(state['last_event'])
+        } for postcode, state in self._state.items()],
+            columns=['postcode', 'sentiment_score', 'sentiment_tumbling', 'event_count', 'last_event'])
+
+class FileTailFeed:
+    """Yields batches of JSON-lines events appended to a local file.
+
+    The read position is kept on the feed, so a consumer that restarts
+    ``batches`` resumes where it stopped.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.2, from_start: bool = False):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.from_start = from_start
+        self._position: Optional[int] = None
+        # Bytes after the last newline; may end inside a multi-byte character
+        self._buffer = b''
+
+    def batches(self, stop: threading.Event) -> Iterator[List[Dict[str, Any]]]:
+        while not stop.is_set():
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                # A file created after we started contains only new events
+                self._position, self._buffer = 0, b''
+                stop.wait(self.poll_interval)
+                continue
+            if self._position is None:
+                self._position = 0 if self.from_start else size
+            if size < self._position:
+                # File was truncated or rotated
+                self._position, self._buffer = 0, b''
+            if size > self._position:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._position)
+                    chunk = f.read()
+                    self._position = f.tell()
+                *lines, self._buffer = (self._buffer + chunk).split(b'\n')
+                events = _parse_events(line.decode('utf-8', errors='replace') for line in lines)
+                if events:
+                    yield events
+                    continue
+            stop.wait(self.poll_interval)
+
+class SocketFeed:
+    """Yields batches of JSON-lines events read from a TCP connection, reconnecting on failure."""
+
+    def __init__(self, host: str, port: int, reconnect_interval: float = 1.0):
+        self.host = host
+        self.port = port
+        self.reconnect_interval = reconnect_interval
+
+    def batches(self, stop: threading.Event) -> Iterator[List[Dict[str, Any]]]:
+        while not stop.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=1.0) as conn:
+                    conn.settimeout(0.5)
+                    buffer = b''
+                    while not stop.is_set():
+                        try:
+                            chunk = conn.recv(65536)
+                        except socket.timeout:
+                            continue
+                        if not chunk:
+                            break
+                        *lines, buffer = (buffer + chunk).split(b'\n')
+                        events = _parse_events(line.decode('utf-8', errors='replace') for line in lines)
+                        if events:
+                            yield events
+            except OSError as e:
+                logger.error(f"Sentiment feed {self.host}:{self.port} unavailable: {str(e)}")
+            stop.wait(self.reconnect_interval)
+
+def _parse_events(lines) -> List[Optional[Dict[str, Any]]]:
+    """Decode JSON lines; malformed lines become None so consumers count them as rejected."""
+    events = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            logger.error(f"Skipping malformed sentiment event: {line[:200]}")
+            events.append(None)
+    return events
+
+class StreamingDataSource(DataSource):
+    """Data source fed by an event stream instead of periodic fetches.
+
+    ``run`` consumes the feed on the calling thread until ``stop()``; use
+    ``start()`` to run it on a daemon thread. ``fetch_data`` returns the
+    current window aggregates so the source still works with batch ingestion.
+    """
+
+    def __init__(self, config: Dict[str, Any], feed, raw_store: Optional[RawDataLake] = None):
+        super().__init__(config, raw_store)
+        self.feed = feed
+        # Seconds to wait before restarting a feed that raised
+        self.restart_interval = 1.0
+        self.feed_errors = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @abstractmethod
+    def process_events(self, events: List[Dict[str, Any]]):
+        """Apply a batch of events"""
+        pass
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                for events in self.feed.batches(self._stop):
+                    try:
+                        self.process_events(events)
+                    except Exception as e:
+                        logger.error(f"Error processing {self.source_name} events: {str(e)}")
+            except Exception as e:
+                # Keep consuming after a feed failure instead of letting the thread die
+                self.feed_errors += 1
+                logger.error(f"{self.source_name} feed failed, restarting: {str(e)}")
+                self._stop.wait(self.restart_interval)
+
+    def start(self) -> threading.Thread:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f'{self.__class__.__name__}-consumer', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+class SentimentStreamSource(StreamingDataSource):
+    """Real-time sentiment events aggregated per postcode.
+
+    Events are JSON objects with ``postcode``, ``sentiment_score`` and an
+    optional epoch/ISO ``timestamp``. After every batch the sliding-window
+    mean of each touched postcode is published to the feature store's
+    in-memory latest vectors as ``sentiment``, so serving picks it up without
+    a batch re-ingest.
+    """
+
+    def __init__(self, config: Dict[str, Any], feed, feature_store: Optional[FeatureStore] = None,
+                 raw_store: Optional[RawDataLake] = None):
+        super().__init__(config, feed, raw_store)
+        stream_config = config.get('datasets', {}).get('sentiment', {}).get('stream', {})
+        self.aggregator = WindowedAggregator(
+            tumbling_seconds=stream_config.get('tumbling_window_seconds', 300),
+            sliding_seconds=stream_config.get('sliding_window_seconds', 3600),
+            bucket_seconds=stream_config.get('bucket_seconds', 60),
+            max_postcodes=stream_config.get('max_postcodes', 10000)
+        )
+        self.feature_store = feature_store
+        self._lock = threading.Lock()
+        self.events_processed = 0
+        self.events_rejected = 0
+        self.last_publish_lag: Optional[float] = None
+
+    @staticmethod
+    def _event_time(event: Dict[str, Any]) -> float:
+        ts = event.get('timestamp')
+        if ts is None:
+            return time.time()
+        if isinstance(ts, (int, float)):
+            return float(ts)
+        return pd.Timestamp(ts).timestamp()
+
+    def process_events(self, events: List[Dict[str, Any]]):
+        touched = {}
+        with self._lock:
+            for event in events:
+                try:
+                    postcode = str(event['postcode'])
+                    value = float(event['sentiment_score'])
+                    ts = self._event_time(event)
+                except (KeyError, TypeError, ValueError):
+                    self.events_rejected += 1
+                    continue
+                self.aggregator.add(postcode, value, ts)
+                touched[postcode] = ts
+                self.events_processed += 1
+            updates = {
+                postcode: {
+                    'sentiment': self.aggregator.sliding_mean(postcode),
+                    'sentiment_tumbling': self.aggregator.tumbling_mean(postcode)
+                }
+                for postcode in touched
+            }
+        if self.feature_store is not None and updates:
+            self.feature_store.publish('sentiment', updates)
+            self.last_publish_lag = time.time() - max(touched.values())
+
+    def fetch_data(self) -> pd.DataFrame:
+        with self._lock:
+            return self.aggregator.snapshot()
+
+    def validate_data(self, data: pd.DataFrame) -> bool:
+        required_columns = ['postcode', 'sentiment_score']
+        return all(col in data.columns for col in required_columns)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'events_processed': self.events_processed,
+                'events_rejected': self.events_rejected,
+                'feed_errors': self.feed_errors,
+                'postcodes': len(self.aggregator._state),
+                'last_publish_lag_seconds': self.last_publish_lag
+            }
+
+def feed_from_config(stream_config: Dict[str, Any]):
+    """Build a FileTailFeed or SocketFeed from a ``stream`` config section."""
+    if stream_config.get('type', 'file') == 'socket':
+        return SocketFeed(stream_config.get('host', '127.0.0.1'), int(stream_config['port']))
+    return FileTailFeed(stream_config['path'], poll_interval=stream_config.get('poll_interval', 0.2))
+
+def load_config(config_path: str = 'data/metadata/data_sources.yaml') -> Dict[str, Any]:
+    """Load data source configuration from YAML"""
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
 class DataIngestion:
     """Main data ingestion coordinator"""
     
-    def __init__(self):
+    def __init__(self, feature_store: Optional[FeatureStore] = None):
         self.config = self._load_config()
+        self.raw_store = RawDataLake.from_config(self.config.get('raw_storage'))
         self.data_sources = self._initialize_sources()
+        self.feature_store = feature_store or FeatureStore()
+        self.errors: List[str] = []
         
     def _load_config(self) -> Dict[str, Any]:
         """Load configuration from YAML"""
-        config_path = 'data/metadata/data_sources.yaml'
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+        return load_config()
     
     def _initialize_sources(self) -> Dict[str, DataSource]:
         """Initialize all data sources"""
         return {
-            'abs': ABSSource(self.config['abs_data']),
-            'property': PropertySource(self.config['property_data'])
+            'abs': ABSSource(self.config['abs_data'], self.raw_store),
+            'property': PropertySource(self.config['property_data'], self.raw_store)
             # Add other sources as implemented
         }
     
@@ -182,6 +499,12 @@ class DataIngestion:
             except Exception as e:
                 logger.error(f"Error ingesting data from {source_name}: {str(e)}")
         return results
+
+    def start_raw_maintenance(self, interval_seconds: float = 3600) -> BackgroundCompactor:
+        """Compact small raw files and drop expired partitions on a background thread"""
+        compactor = BackgroundCompactor(self.raw_store, interval_seconds)
+        compactor.start()
+        return compactor
     
     def process_data(self, raw_data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
         """Process and combine data from all sources"""
@@ -190,18 +513,17 @@ class DataIngestion:
         # Start with property data as base
         if 'property' not in raw_data:
             raise ValueError("Property data is required but missing")
-            
-        combined_data = raw_data['property']
-        
-        # Merge with other sources
+
+        # Only rows that changed since the last run are written to the store
         for source_name, data in raw_data.items():
-            if source_name != 'property':
-                combined_data = combined_data.merge(
-                    data,
-                    on='postcode',
-                    how='left'
-                )
-        
+            try:
+                self.feature_store.upsert(source_name, data)
+            except ValueError as e:
+                self._report_error(f"Skipping source {source_name}: {str(e)}")
+
+        combined_data = self.feature_store.latest_frame(base_source='property')
+        combined_data['as_of'] = pd.Timestamp(datetime.now()).normalize()
+
         # Calculate derived metrics
         combined_data['risk_score'] = self._calculate_risk_score(combined_data)
         
@@ -213,13 +535,26 @@ class DataIngestion:
             'features',
             f'processed_data_{timestamp}.parquet'
         )
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
         combined_data.to_parquet(output_path, index=False)
         logger.info(f"Processed data saved to {output_path}")
         
         return combined_data
     
+    def _report_error(self, message: str):
+        logger.error(message)
+        self.errors.append(message)
+
     def _calculate_risk_score(self, data: pd.DataFrame) -> pd.Series:
         """Calculate risk score based on various metrics"""
+        required_columns = ['growth_rate', 'employment_rate', 'total_listings']
+        missing_columns = [col for col in required_columns if col not in data.columns]
+        if missing_columns:
+            self._report_error(
+                f"Cannot calculate risk score, missing columns: {', '.join(missing_columns)}"
+            )
+            return pd.Series(np.nan, index=data.index, dtype=np.float32)
+
         # Implement risk score calculation
         # This is a simplified version
         return (
@@ -231,7 +566,11 @@ class DataIngestion:
 def main():
     ingestion = DataIngestion()
     raw_data = ingestion.ingest_all()
+    # Raw files are all written; compact them while the features are processed
+    compactor = ingestion.start_raw_maintenance()
     processed_data = ingestion.process_data(raw_data)
+    compactor.stop()
+    compactor.join()
     logger.info(f"Data ingestion complete! Processed {len(processed_data)} records")
 
 if __name__ == "__main__":
@@ -0,0 +1,428 @@
+"""
+Load-testing harness for the ML API.
+
+Starts ``src.ml.api:app`` and a fake OpenAI-compatible server (so insight
+generation exercises the real client code without network calls or cost),
+drives mixed /predict, /summary and /health traffic at a fixed concurrency and
+reports throughput, latency percentiles, error rate and API process CPU and
+memory.
+
+Usage:
+    python -m src.ml.loadtest --concurrency 32 --duration 30 --output loadtest.json
+    python -m src.ml.loadtest --app-url http://localhost:8000   # existing server
+    python -m src.ml.loadtest fake-llm --port 8100              # fake LLM only
+    python -m src.ml.loadtest idle-streams --streams 3000       # /zones/updates memory and idle CPU
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+import numpy as np
+
+import psutil
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Relative weights of each request type in the generated traffic
+DEFAULT_MIX = {
+    'predict_single': 0.5,
+    'predict_batch': 0.2,
+    'summary': 0.2,
+    'health': 0.1
+}
+
+SAMPLE_POSTCODES = ['2000', '2026', '2028', '2010', '2060', '2088', '2095', '2110']
+
+def create_fake_llm_app(latency_ms: float = 200.0, jitter_ms: float = 50.0, error_rate: float = 0.0):
+    """OpenAI-compatible /v1/chat/completions stand-in with configurable latency and errors."""
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI(title="Fake LLM")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: Dict[str, Any]):
+        delay = max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if random.random() < error_rate:
+            return JSONResponse(status_code=500, content={"error": {"message": "injected failure"}})
+        return {
+            "id": "chatcmpl-loadtest",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": "Load-test summary.\nStable fundamentals with moderate risk."
+                }
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    return app
+
+def _zone(postcode: str) -> Dict[str, Any]:
+    return {
+        'postcode': postcode,
+        'growth_rate': round(random.uniform(0.0, 8.0), 2),
+        'crime_rate': round(random.uniform(0.0, 3.0), 2),
+        'infrastructure_score': round(random.uniform(3.0, 10.0), 2),
+        'sentiment': round(random.uniform(0.3, 0.9), 2),
+        'interest_rate': 4.5,
+        'wages': round(random.uniform(60000, 120000)),
+        'housing_supply_encoded': random.choice([0.0, 0.5, 1.0]),
+        'immigration_encoded': random.choice([0.0, 0.5, 1.0])
+    }
+
+def _request_for(kind: str, batch_size: int):
+    if kind == 'predict_single':
+        return 'POST', '/predict', [_zone(random.choice(SAMPLE_POSTCODES))]
+    if kind == 'predict_batch':
+        return 'POST', '/predict', [_zone(random.choice(SAMPLE_POSTCODES)) for _ in range(batch_size)]
+    if kind == 'summary':
+        return 'GET', '/summary', None
+    return 'GET', '/health', None
+
+def _percentiles(latencies: List[float]) -> Dict[str, Optional[float]]:
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'mean_ms': round(float(values.mean()), 2),
+        'max_ms': round(float(values.max()), 2)
+    }
+
+class ProcessSampler:
+    """Samples CPU and RSS of a process in the background while the load runs."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.interval = interval
+        self.process = psutil.Process(pid) if pid else None
+        self.cpu: List[float] = []
+        self.rss: List[int] = []
+        self._task = None
+
+    async def _run(self):
+        self.process.cpu_percent(None)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.cpu.append(self.process.cpu_percent(None))
+                self.rss.append(self.process.memory_info().rss)
+            except psutil.Error:
+                return
+
+    def start(self):
+        if self.process is not None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> Optional[Dict[str, float]]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if not self.cpu:
+            return None
+        return {
+            'cpu_percent_mean': round(float(np.mean(self.cpu)), 1),
+            'cpu_percent_max': round(float(np.max(self.cpu)), 1),
+            'rss_mb_mean': round(float(np.mean(self.rss)) / 2**20, 1),
+            'rss_mb_max': round(float(np.max(self.rss)) / 2**20, 1)
+        }
+
+async def run_load(base_url: str, concurrency: int, duration: float, mix: Dict[str, float],
+                   batch_size: int = 20, warmup: float = 2.0, pid: Optional[int] = None,
+                   timeout: float = 30.0) -> Dict[str, Any]:
+    """Drive traffic with ``concurrency`` closed-loop workers for ``duration`` seconds."""
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    latencies: Dict[str, List[float]] = {kind: [] for kind in kinds}
+    errors: Dict[str, int] = {kind: 0 for kind in kinds}
+    status_codes: Dict[str, int] = {}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker(deadline: float, record: bool):
+            while time.perf_counter() < deadline:
+                kind = random.choices(kinds, weights)[0]
+                method, path, body = _request_for(kind, batch_size)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    code = str(response.status_code)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError as e:
+                    code = type(e).__name__
+                    failed = True
+                elapsed = time.perf_counter() - start
+                if not record:
+                    continue
+                latencies[kind].append(elapsed)
+                status_codes[code] = status_codes.get(code, 0) + 1
+                if failed:
+                    errors[kind] += 1
+
+        if warmup > 0:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(deadline, False) for _ in range(concurrency)))
+
+        sampler = ProcessSampler(pid)
+        sampler.start()
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(worker(deadline, True) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        process_stats = await sampler.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    total = len(all_latencies)
+    total_errors = sum(errors.values())
+    return {
+        'requests': total,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        'error_rate': round(total_errors / total, 4) if total else 0.0,
+        'latency': _percentiles(all_latencies),
+        'status_codes': status_codes,
+        'endpoints': {
+            kind: dict(
+                requests=len(latencies[kind]),
+                error_rate=round(errors[kind] / len(latencies[kind]), 4) if latencies[kind] else 0.0,
+                **_percentiles(latencies[kind])
+            )
+            for kind in kinds
+        },
+        'process': process_stats
+    }
+
+async def _open_zone_stream(host: str, port: int, postcode: str):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET /zones/updates?postcodes={postcode} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b'event: ready')
+    return writer
+
+async def run_idle_streams(base_url: str, streams: int, idle_seconds: float,
+                           pid: Optional[int] = None) -> Dict[str, Any]:
+    """Hold ``streams`` idle /zones/updates connections open and measure what they cost the API."""
+    url = urlparse(base_url)
+    process = psutil.Process(pid) if pid else None
+    rss_before = process.memory_info().rss if process else None
+
+    start = time.perf_counter()
+    writers = []
+    # Open in waves so the accept backlog isn't overrun
+    for offset in range(0, streams, 500):
+        writers += await asyncio.gather(*[
+            _open_zone_stream(url.hostname, url.port, SAMPLE_POSTCODES[i % len(SAMPLE_POSTCODES)])
+            for i in range(offset, min(streams, offset + 500))
+        ])
+    connect_seconds = time.perf_counter() - start
+    await asyncio.sleep(1.0)
+
+    rss_after = process.memory_info().rss if process else None
+    cpu_before = sum(process.cpu_times()[:2]) if process else None
+    await asyncio.sleep(idle_seconds)
+    cpu_after = sum(process.cpu_times()[:2]) if process else None
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        stats = (await client.get('/streams/zones')).json()
+
+    for writer in writers:
+        writer.close()
+    return {
+        'streams': streams,
+        'subscribers': stats.get('subscribers'),
+        'connect_seconds': round(connect_seconds, 2),
+        'idle_seconds': idle_seconds,
+        'rss_mb_before': round(rss_before / 2**20, 1) if process else None,
+        'rss_mb_after': round(rss_after / 2**20, 1) if process else None,
+        'rss_kb_per_stream': round((rss_after - rss_before) / 1024 / streams, 1) if process else None,
+        'idle_cpu_percent': round(100 * (cpu_after - cpu_before) / idle_seconds, 2) if process else None
+    }
+
+def _raise_fd_limit(needed: int):
+    """Allow enough open sockets for ``needed`` connections here and in the API child process."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+def _start_server(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn'] + args + ['--log-level', 'warning'],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    raise TimeoutError(f"Server at {url} did not start within {timeout}s")
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(report: Dict[str, Any]):
+    results = report['results']
+    latency = results['latency']
+    print(f"\n{results['requests']} requests in {results['seconds']}s "
+          f"({results['throughput_rps']} req/s), error rate {results['error_rate']:.2%}")
+    print(f"latency p50={latency['p50_ms']}ms p95={latency['p95_ms']}ms p99={latency['p99_ms']}ms")
+    for kind, stats in results['endpoints'].items():
+        print(f"  {kind:<15} n={stats['requests']:<6} p50={stats['p50_ms']}ms "
+              f"p99={stats['p99_ms']}ms errors={stats['error_rate']:.2%}")
+    if results['process']:
+        process = results['process']
+        print(f"API process: cpu mean {process['cpu_percent_mean']}% (max {process['cpu_percent_max']}%), "
+              f"rss max {process['rss_mb_max']} MB")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the ML API")
+    parser.add_argument('mode', nargs='?', choices=['run', 'fake-llm', 'idle-streams'], default='run')
+    parser.add_argument('--app-url', default=None, help="Target an already running API instead of starting one")
+    parser.add_argument('--app-port', type=int, default=8765)
+    parser.add_argument('--llm-port', type=int, default=8766)
+    parser.add_argument('--port', type=int, default=None, help="Port for fake-llm mode")
+    parser.add_argument('--llm-latency-ms', type=float, default=200.0)
+    parser.add_argument('--llm-jitter-ms', type=float, default=50.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--no-llm', action='store_true', help="Run the API without an OpenAI key (rule-based insights)")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds before measuring")
+    parser.add_argument('--batch-size', type=int, default=20, help="Zones per batch /predict request")
+    parser.add_argument('--mix', default=None, help="JSON weights, e.g. '{\"predict_single\": 1, \"health\": 1}'")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--streams', type=int, default=3000, help="Connections for idle-streams mode")
+    parser.add_argument('--idle-seconds', type=float, default=20.0, help="Measured idle time for idle-streams mode")
+    parser.add_argument('--output', default=None, help="Write the JSON report here")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.mode == 'fake-llm':
+        import uvicorn
+        app = create_fake_llm_app(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate)
+        uvicorn.run(app, host='127.0.0.1', port=args.port or args.llm_port, log_level='warning')
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+    idle_streams = args.mode == 'idle-streams'
+    if idle_streams:
+        _raise_fd_limit(args.streams + 1024)
+
+    processes = []
+    try:
+        base_url = args.app_url
+        pid = None
+        if base_url is None:
+            env = dict(os.environ)
+            if args.no_llm or idle_streams:
+                env.pop('OPENAI_API_KEY', None)
+            else:
+                llm = subprocess.Popen(
+                    [sys.executable, '-m', 'src.ml.loadtest', 'fake-llm', '--port', str(args.llm_port),
+                     '--llm-latency-ms', str(args.llm_latency_ms), '--llm-jitter-ms', str(args.llm_jitter_ms),
+                     '--llm-error-rate', str(args.llm_error_rate)],
+                    cwd=PROJECT_ROOT
+                )
+                processes.append(llm)
+                _wait_until_up(f'http://127.0.0.1:{args.llm_port}/docs', llm)
+                env['OPENAI_API_KEY'] = 'loadtest'
+                env['OPENAI_BASE_URL'] = f'http://127.0.0.1:{args.llm_port}/v1'
+
+            api = _start_server(['src.ml.api:app', '--host', '127.0.0.1', '--port', str(args.app_port)], env)
+            processes.append(api)
+            base_url = f'http://127.0.0.1:{args.app_port}'
+            _wait_until_up(f'{base_url}/health', api)
+            pid = api.pid
+
+        if idle_streams:
+            print(f"Holding {args.streams} idle zone update streams open on {base_url}...")
+            results = asyncio.run(run_idle_streams(base_url, args.streams, args.idle_seconds, pid=pid))
+        else:
+            print(f"Driving {base_url} with {args.concurrency} concurrent clients for {args.duration}s...")
+            results = asyncio.run(run_load(base_url, args.concurrency, args.duration, mix,
+                                           batch_size=args.batch_size, warmup=args.warmup, pid=pid))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    if idle_streams:
+        report = {'timestamp': datetime.now().isoformat(), 'commit': _git_commit(), 'results': results}
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Report saved to {args.output}")
+        return report
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': _git_commit(),
+        'config': {
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'batch_size': args.batch_size,
+            'mix': mix,
+            'llm': None if args.no_llm or args.app_url else {
+                'latency_ms': args.llm_latency_ms,
+                'jitter_ms': args.llm_jitter_ms,
+                'error_rate': args.llm_error_rate
+            }
+        },
+        'results': results
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    main()
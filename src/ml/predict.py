@@ -1,8 +1,11 @@
+import asyncio
+import hashlib
 import pandas as pd
 import numpy as np
 from joblib import load
 import joblib
 import os
+import re
 from datetime import datetime
 import json
 from openai import OpenAI
@@ -10,16 +13,109 @@ from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 
+from .drift import DriftMonitor, ReferenceProfile, profile_path_for
+from .explain import ContributionExplainer, top_drivers
+from .shadow import ABRouter, ModelVariant, ShadowScorer
+from .feature_store import FEATURE_STORE_DIR, FeatureStore
+from .zone_updates import ZoneUpdateHub
+
 # Load environment variables
 load_dotenv()
 
+# Model input columns, in the order the model was trained on
+FEATURE_COLUMNS = [
+    'growth_rate', 'crime_rate', 'infrastructure_score',
+    'sentiment', 'interest_rate', 'wages',
+    'housing_supply_encoded', 'immigration_encoded'
+]
+
+# Values used when a request omits a feature
+FEATURE_DEFAULTS = {
+    'growth_rate': 3.5,
+    'crime_rate': 1.2,
+    'infrastructure_score': 6.5,
+    'sentiment': 0.65,
+    'interest_rate': 4.5,
+    'wages': 85000,
+    'housing_supply_encoded': 0.5,
+    'immigration_encoded': 0.5
+}
+
+def resolve_model_path(model_path):
+    """The file load_model will actually read: the JSON model if present, else ``model_path``."""
+    json_path = model_path.replace('.joblib', '.json')
+    return json_path if os.path.exists(json_path) else model_path
+
+def compute_model_version(model_path) -> Optional[str]:
+    """Short content hash of the model file, used to key caches and stored predictions."""
+    path = resolve_model_path(model_path)
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+def load_model(model_path):
+    """Load a trained model, preferring the XGBoost JSON next to a joblib path."""
+    json_path = model_path.replace('.joblib', '.json')
+    if os.path.exists(json_path):
+        print(f"Attempting to load JSON model from {json_path}")
+        from xgboost import XGBRegressor
+        model = XGBRegressor()
+        model.load_model(json_path)
+        print(f"Model loaded successfully from {json_path}")
+    else:
+        print(f"JSON model not found at {json_path}, falling back to joblib")
+        # Fall back to joblib format
+        model = load(model_path)
+        print(f"Model loaded successfully from {model_path}")
+    return model
+
+def build_feature_matrix(df: pd.DataFrame) -> np.ndarray:
+    """Model input matrix for ``df``, filling missing features with defaults."""
+    X = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for i, feature in enumerate(FEATURE_COLUMNS):
+        if feature in df.columns:
+            X[:, i] = pd.to_numeric(df[feature], errors='coerce').fillna(FEATURE_DEFAULTS[feature]).to_numpy()
+        else:
+            X[:, i] = FEATURE_DEFAULTS[feature]
+    return X
+
+def predict_matrix(model, X: np.ndarray) -> np.ndarray:
+    """Score a feature matrix in one model call, or the neutral 65.0 without a model."""
+    if model is None:
+        return np.full(len(X), 65.0)
+    return np.asarray(model.predict(X), dtype=float)
+
+def score_features(model, df: pd.DataFrame) -> np.ndarray:
+    """Score a whole frame in one model call, filling missing features with defaults."""
+    return predict_matrix(model, build_feature_matrix(df))
+
+def score_to_color(scores: np.ndarray) -> np.ndarray:
+    """Vectorised version of the colour thresholds used by PredictionService.predict."""
+    scores = np.asarray(scores, dtype=float)
+    return np.select([scores >= 75, scores >= 50], ['green', 'yellow'], default='red')
+
 class PredictionService:
-    def __init__(self, model_path='models/zone_predictor.joblib', predictions_dir='data/predictions'):
+    def __init__(self, model_path='models/zone_predictor.joblib', predictions_dir='data/predictions',
+                 feature_store: Optional[FeatureStore] = None, explain_insights: bool = True):
         """Initialize the prediction service with a trained model."""
         self.model_path = model_path
         self.predictions_dir = predictions_dir
         self.model = None
+        self.model_version = None
+        # Bumped whenever the model or saved predictions change
+        self.generation = 0
         self.openai_client = None
+        # Feature contributions, cached per model version; optionally added to insights
+        self.explainer = ContributionExplainer(FEATURE_COLUMNS)
+        self.explain_insights = explain_insights
+        # Latest stored features fill inputs a request leaves out
+        if feature_store is None and os.path.isdir(FEATURE_STORE_DIR):
+            feature_store = FeatureStore()
+        self.feature_store = feature_store
         
         # Debug logging
         import sys
@@ -39,19 +135,8 @@ class PredictionService:
             self.openai_client = None
 
         try:
-            # Try loading the JSON format first
-            json_path = model_path.replace('.joblib', '.json')
-            if os.path.exists(json_path):
-                print(f"Attempting to load JSON model from {json_path}")
-                from xgboost import XGBRegressor
-                self.model = XGBRegressor()
-                self.model.load_model(json_path)
-                print(f"Model loaded successfully from {json_path}")
-            else:
-                print(f"JSON model not found at {json_path}, falling back to joblib")
-                # Fall back to joblib format
-                self.model = load(model_path)
-                print(f"Model loaded successfully from {model_path}")
+            self.model = load_model(model_path)
+            self.model_version = compute_model_version(model_path)
         except Exception as e:
             print(f"Warning: Could not load model from {model_path}: {str(e)}")
             print(f"Exception type: {type(e)}")
@@ -59,6 +144,187 @@ class PredictionService:
             print(f"Traceback: {traceback.format_exc()}")
             self.model = None
 
+        self.drift_monitor = self._load_drift_monitor()
+
+        # Optional A/B routing between model versions and shadow scoring of a candidate
+        self.router: Optional[ABRouter] = None
+        self.shadow: Optional[ShadowScorer] = None
+        shadow_model_path = os.getenv('SHADOW_MODEL_PATH')
+        if shadow_model_path:
+            try:
+                self.configure_shadow(shadow_model_path, float(os.getenv('SHADOW_SAMPLE_RATE', '0.1')))
+            except Exception as e:
+                print(f"Warning: Could not load shadow model from {shadow_model_path}: {str(e)}")
+
+        # Pushes changed zone scores to subscribers; starts from the saved predictions
+        self.zone_updates = ZoneUpdateHub()
+        self._zone_predictions_signature = self._predictions_signature()
+        current = self._load_current_predictions()
+        if current is not None and 'predicted_score' in current.columns:
+            self.zone_updates.seed(*self._zone_values(current))
+
+    def _load_variant(self, name: str, model_path: str, weight: float = 1.0) -> ModelVariant:
+        if model_path == self.model_path:
+            return ModelVariant(name, self.model, self.model_version, weight)
+        return ModelVariant(name, load_model(model_path), compute_model_version(model_path), weight)
+
+    def configure_shadow(self, model_path: str, sample_rate: float = 0.1):
+        """Score a ``sample_rate`` fraction of live batches with the model at ``model_path``."""
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        candidate = self._load_variant('candidate', model_path)
+        if candidate.model is not self.model and hasattr(candidate.model, 'set_params'):
+            # A single thread keeps shadow scoring from competing with live requests for cores
+            candidate.model.set_params(n_jobs=1)
+        previous, self.shadow = self.shadow, ShadowScorer(candidate, sample_rate, self.predictions_dir)
+        if previous is not None:
+            previous.shutdown()
+
+    def disable_shadow(self):
+        if self.shadow is not None:
+            self.shadow.shutdown()
+            self.shadow = None
+
+    def configure_routing(self, variants: List[Dict]):
+        """Route batches between ``[{name, model_path, weight}, ...]`` by weight."""
+        self.router = ABRouter([
+            self._load_variant(v['name'], v['model_path'], float(v.get('weight', 1.0))) for v in variants
+        ])
+        self.generation += 1
+        self._rescore_zones('routing')
+
+    def clear_routing(self):
+        self.router = None
+        self.generation += 1
+        self._rescore_zones('routing')
+
+    def reload_model(self, model_path: Optional[str] = None):
+        """Load a (new) model in place; the old one keeps serving if loading fails."""
+        model_path = model_path or self.model_path
+        model = load_model(model_path)
+        self.model_path = model_path
+        self.model = model
+        self.model_version = compute_model_version(model_path)
+        self.drift_monitor = self._load_drift_monitor()
+        self.generation += 1
+        print(f"Model {self.model_version} loaded from {resolve_model_path(model_path)}")
+        self._rescore_zones('model')
+
+    def _load_current_predictions(self) -> Optional[pd.DataFrame]:
+        try:
+            return pd.read_csv(os.path.join(self.predictions_dir, 'current_predictions.csv'),
+                               dtype={'postcode': str})
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return None
+
+    def _zone_values(self, predictions: pd.DataFrame):
+        """(postcodes, scores, colours, model versions) of a predictions frame."""
+        scores = predictions['predicted_score'].to_numpy(dtype=float)
+        if 'zone_category' in predictions.columns:
+            colors = predictions['zone_category']
+        elif 'color' in predictions.columns:
+            colors = predictions['color']
+        else:
+            colors = score_to_color(scores)
+        versions = (predictions['model_version'].where(predictions['model_version'].notna(), None)
+                    if 'model_version' in predictions.columns else [self.model_version] * len(predictions))
+        return predictions['postcode'].astype(str).tolist(), scores, list(colors), list(versions)
+
+    def _rescore_zones(self, reason: str) -> int:
+        """Re-score the zones in the saved predictions after a model change and push what changed.
+
+        Each zone is scored by the variant a single-zone request for it would be routed to.
+        """
+        current = self._load_current_predictions()
+        if current is None or self.model is None or not set(FEATURE_COLUMNS) <= set(current.columns):
+            return 0
+        try:
+            postcodes = current['postcode'].astype(str).tolist()
+            X = build_feature_matrix(current)
+            scores = np.empty(len(current))
+            versions = [self.model_version] * len(current)
+            if self.router is None:
+                scores[:] = predict_matrix(self.model, X)
+            else:
+                routed = [self.router.route(postcode) for postcode in postcodes]
+                for variant in {id(v): v for v in routed}.values():
+                    mask = np.array([v is variant for v in routed])
+                    scores[mask] = predict_matrix(variant.model, X[mask])
+                versions = [v.version for v in routed]
+            return self.zone_updates.publish(postcodes, scores, score_to_color(scores), versions, reason)
+        except Exception as e:
+            print(f"Error re-scoring zones after {reason} change: {str(e)}")
+            return 0
+
+    def _predictions_signature(self) -> str:
+        """mtime and size of current_predictions.csv, which is also written outside the service."""
+        try:
+            stat = os.stat(os.path.join(self.predictions_dir, 'current_predictions.csv'))
+            return f"{stat.st_mtime_ns}:{stat.st_size}"
+        except FileNotFoundError:
+            return "none"
+
+    def state_token(self) -> str:
+        """Identifies the model and saved predictions currently being served."""
+        return f"{self.model_version}:{self.generation}:{self._predictions_signature()}"
+
+    def feature_revisions(self, records: List[Dict]) -> Dict[str, int]:
+        """Store revision of each postcode whose omitted features prepare_features would fill.
+
+        Part of a /predict cache key, so a stored or streamed update only invalidates the
+        requests that actually depend on it.
+        """
+        if self.feature_store is None:
+            return {}
+        revisions = {}
+        for record in records:
+            if all(record.get(feature) is not None for feature in FEATURE_COLUMNS):
+                continue
+            digits = re.search(r'\d+', str(record.get('postcode', '')))
+            if digits:
+                postcode = str(int(digits.group()))
+                revisions[postcode] = self.feature_store.postcode_revision(postcode)
+        return revisions
+
+    def refresh_zone_updates(self) -> int:
+        """Push the zones changed by a new current_predictions.csv. Returns the number pushed."""
+        signature = self._predictions_signature()
+        if signature == self._zone_predictions_signature:
+            return 0
+        try:
+            current = self._load_current_predictions()
+        except (pd.errors.ParserError, ValueError) as e:
+            print(f"Could not read current predictions, retrying on the next check: {str(e)}")
+            return 0
+        if self._predictions_signature() != signature:
+            # Still being written; pick it up once it settles
+            return 0
+        self._zone_predictions_signature = signature
+        if current is None or 'predicted_score' not in current.columns:
+            return 0
+        return self.zone_updates.publish(*self._zone_values(current), reason='predictions')
+
+    def refresh_features(self) -> int:
+        """Index feature store parts written by ingestion since the last check. Returns the number read."""
+        if self.feature_store is None:
+            if not os.path.isdir(FEATURE_STORE_DIR):
+                return 0
+            self.feature_store = FeatureStore()
+            return len(self.feature_store.sources())
+        return self.feature_store.refresh()
+
+    def _load_drift_monitor(self) -> Optional[DriftMonitor]:
+        """Drift monitor against the reference profile saved with the model, if any."""
+        profile_path = profile_path_for(resolve_model_path(self.model_path))
+        if not os.path.exists(profile_path):
+            print(f"No reference profile at {profile_path}, drift monitoring disabled")
+            return None
+        try:
+            return DriftMonitor(ReferenceProfile.load(profile_path))
+        except Exception as e:
+            print(f"Could not load reference profile from {profile_path}: {str(e)}")
+            return None
+
     def _load_model(self):
         """Load the trained model."""
         try:
@@ -108,33 +374,72 @@ class PredictionService:
                 'immigration_encoded'
             ]
 
-            # Fill missing values with defaults
-            defaults = {
-                'growth_rate': 3.5,
-                'crime_rate': 1.2,
-                'infrastructure_score': 6.5,
-                'sentiment': 0.65,
-                'interest_rate': 4.5,
-                'wages': 85000,
-                'housing_supply_encoded': 0.5,
-                'immigration_encoded': 0.5
-            }
+            # Fill missing values from the feature store, then with defaults
+            if self.feature_store is not None:
+                stored = [
+                    self.feature_store.get_latest(str(int(pc))) or {} if pd.notna(pc) else {}
+                    for pc in df['postcode']
+                ]
+                for feature in required_features[1:]:
+                    values = pd.to_numeric(
+                        pd.Series([vector.get(feature) for vector in stored], index=df.index, dtype=object),
+                        errors='coerce'
+                    )
+                    df[feature] = df[feature].fillna(values) if feature in df.columns else values
+
+            # Record which values fall back to defaults before filling them in
+            filled = np.column_stack([
+                df[feature].isna().to_numpy() if feature in df.columns else np.ones(len(df), dtype=bool)
+                for feature in FEATURE_COLUMNS
+            ])
 
             for feature in required_features:
                 if feature not in df.columns:
-                    df[feature] = defaults.get(feature, 0)
+                    df[feature] = FEATURE_DEFAULTS.get(feature, 0)
+                elif feature in FEATURE_DEFAULTS:
+                    df[feature] = df[feature].fillna(FEATURE_DEFAULTS[feature])
 
             # Convert all columns to float
             for col in df.columns:
                 df[col] = df[col].astype(float)
 
+            if self.drift_monitor is not None:
+                self.drift_monitor.update(df[FEATURE_COLUMNS].to_numpy(), filled)
+
             return df
 
         except Exception as e:
             print(f"Error preparing features: {str(e)}")
             return None
 
-    def _generate_rule_based_insights(self, zone_data: Dict) -> Dict:
+    def explain(self, df: pd.DataFrame, variant: Optional[ModelVariant] = None) -> Optional[List[Dict[str, float]]]:
+        """Per-feature contributions for every row of a prepared frame, or None if unsupported."""
+        model = variant.model if variant else self.model
+        version = variant.version if variant else self.model_version
+        if model is None or not self.explainer.supports(model):
+            return None
+        return self.explainer.explain(model, version or 'unknown', build_feature_matrix(df))
+
+    def get_zone_features(self, postcode: str) -> Optional[Dict]:
+        """Feature values for a zone from the current predictions, then the feature store."""
+        try:
+            current = pd.read_csv(
+                os.path.join(self.predictions_dir, 'current_predictions.csv'),
+                dtype={'postcode': str}
+            )
+            match = current[current['postcode'] == str(postcode)]
+            if not match.empty:
+                return match.iloc[-1][['postcode'] + FEATURE_COLUMNS].to_dict()
+        except (FileNotFoundError, KeyError):
+            pass
+        if self.feature_store is not None:
+            stored = self.feature_store.get_latest(str(postcode))
+            if stored is not None:
+                return dict(stored, postcode=str(postcode))
+        return None
+
+    @staticmethod
+    def _generate_rule_based_insights(zone_data: Dict, contributions: Optional[Dict[str, float]] = None) -> Dict:
         """Generate rule-based insights when AI is not available."""
         try:
             # Calculate scores
@@ -164,6 +469,13 @@ class PredictionService:
             Overall Assessment:
             This zone demonstrates {total_score:.1f}% alignment with optimal investment criteria.
             """
+
+            drivers = top_drivers(contributions)
+            if drivers:
+                analysis += "Key Drivers:\n" + "".join(
+                    f"            - {name.replace('_', ' ').title()}: {value:+.1f} points\n"
+                    for name, value in drivers
+                )
             
             return {
                 "summary": summary,
@@ -181,10 +493,11 @@ class PredictionService:
                 "generated_by": "error-handler"
             }
 
-    async def generate_ai_insights(self, zone_data: Dict, predicted_score: float) -> Dict:
+    async def generate_ai_insights(self, zone_data: Dict, predicted_score: float,
+                                   contributions: Optional[Dict[str, float]] = None) -> Dict:
         """Generate AI insights using OpenAI for a specific zone."""
         if not self.openai_client:
-            return self._generate_rule_based_insights(zone_data)
+            return self._generate_rule_based_insights(zone_data, contributions)
 
         try:
             # Format metrics for analysis
@@ -199,6 +512,13 @@ class PredictionService:
                 'immigration': zone_data.get('immigration', 'Unknown')
             }
             
+            drivers = top_drivers(contributions)
+            drivers_context = ""
+            if drivers:
+                drivers_context = "\n            Largest model score contributions (points):\n" + "".join(
+                    f"            - {name}: {value:+.1f}\n" for name, value in drivers
+                )
+
             # Prepare context for OpenAI
             context = f"""
             Analyze this real estate zone data and provide investment insights:
@@ -214,7 +534,7 @@ class PredictionService:
             - Average Wages: {metrics['wages']}
             - Housing Supply: {metrics['housing_supply']}
             - Immigration Trend: {metrics['immigration']}
-            
+            {drivers_context}
             Provide:
             1. A brief summary (1-2 sentences)
             2. Detailed analysis of investment potential
@@ -250,7 +570,7 @@ class PredictionService:
 
         except Exception as e:
             print(f"Error generating AI insights: {str(e)}")
-            return self._generate_rule_based_insights(zone_data)
+            return self._generate_rule_based_insights(zone_data, contributions)
 
     async def predict(self, features_df):
         """Make predictions for the given features."""
@@ -260,23 +580,37 @@ class PredictionService:
             if df is None:
                 raise ValueError("Failed to prepare features")
 
+            postcodes = [str(int(pc)) if pd.notna(pc) else '' for pc in df['postcode']]
+            variant = self.router.route(','.join(sorted(postcodes))) if self.router else None
+            model = variant.model if variant else self.model
+            model_version = variant.version if variant else self.model_version
+
+            # Score the whole batch in one model call
+            X = build_feature_matrix(df)
+            scores = predict_matrix(model, X)
+            if self.shadow is not None:
+                self.shadow.submit(X, postcodes, scores, model_version)
+
+            contributions = None
+            if self.explain_insights:
+                try:
+                    contributions = self.explain(df, variant)
+                except Exception as e:
+                    print(f"Error computing feature contributions: {e}")
+
             # Make predictions
             predictions = []
-            for _, row in df.iterrows():
+            for i, (_, row) in enumerate(df.iterrows()):
                 try:
                     # Extract postcode
                     postcode = str(int(row['postcode']))
-                    
-                    # Create feature array
-                    features = row[['growth_rate', 'crime_rate', 'infrastructure_score',
-                                  'sentiment', 'interest_rate', 'wages',
-                                  'housing_supply_encoded', 'immigration_encoded']].values.reshape(1, -1)
-                    
-                    # Get prediction
-                    score = float(self.model.predict(features)[0]) if self.model else 65.0
-                    
+
+                    score = float(scores[i])
+
                     # Generate insights
-                    insights = await self.generate_ai_insights(row.to_dict(), score)
+                    insights = await self.generate_ai_insights(
+                        row.to_dict(), score, contributions[i] if contributions else None
+                    )
                     
                     # Determine color based on score
                     if score >= 75:
@@ -290,6 +624,7 @@ class PredictionService:
                         "postcode": postcode,
                         "predicted_score": score,
                         "color": color,
+                        "model_version": model_version,
                         "metrics": {
                             "risk_score": score,
                             "growth_rate": float(row['growth_rate']),
@@ -350,6 +685,18 @@ class PredictionService:
                 }
             }
 
+    def record_cached_prediction(self, features_df, predictions):
+        """Drift monitoring and shadow sampling for a batch answered from the response cache."""
+        df = self.prepare_features(features_df)
+        if df is None or self.shadow is None:
+            return
+        predictions = predictions if isinstance(predictions, list) else [predictions]
+        if len(predictions) != len(df) or any(p.get('predicted_score') is None for p in predictions):
+            return
+        postcodes = [str(int(pc)) if pd.notna(pc) else '' for pc in df['postcode']]
+        scores = np.array([p['predicted_score'] for p in predictions], dtype=float)
+        self.shadow.submit(build_feature_matrix(df), postcodes, scores, predictions[0].get('model_version'))
+
     def get_color(self, score):
         if score is None:
             return 'gray'
@@ -368,6 +715,10 @@ class PredictionService:
         # Also save a current version for the API
         current_predictions = os.path.join(self.predictions_dir, 'current_predictions.csv')
         predictions.to_csv(current_predictions, index=False)
+        self.generation += 1
+        self._zone_predictions_signature = self._predictions_signature()
+        if 'predicted_score' in predictions.columns:
+            self.zone_updates.publish(*self._zone_values(predictions), reason='predictions')
 
     def get_zone_summary(self):
         """Get a summary of current zone predictions."""
@@ -409,9 +760,12 @@ def main():
     })
     
     # Make predictions
-    predictions = predictor.predict(example_data)
+    predictions = asyncio.run(predictor.predict(example_data))
+    if isinstance(predictions, dict):
+        predictions = [predictions]
     print("\nPredictions made:")
-    print(predictions[['postcode', 'predicted_score', 'zone_category']])
+    for prediction in predictions:
+        print(f"{prediction['postcode']}: {prediction['predicted_score']} ({prediction['color']})")
     
     # Get summary
     summary = predictor.get_zone_summary()
@@ -0,0 +1,333 @@
+"""
+Partitioned raw-data lake for ingested source data.
+
+Layout:
+    data/raw/<source>/date=YYYY-MM-DD/<dataset>_<timestamp>.parquet
+    data/raw/_manifest.json
+
+Every write is recorded in the manifest, so readers select files by source and
+date without listing directories. Manifest updates re-read the file under an
+exclusive lock, so several processes (ingestion and the compaction CLI) can
+share one lake. ``compact`` merges the small files of each
+partition into one, dropping rows with identical content, and
+``apply_retention`` removes partitions older than the retention window.
+
+Usage:
+    python -m src.ml.raw_store compact
+    python -m src.ml.raw_store retention            # raw_storage.retention_days from the config
+    python -m src.ml.raw_store retention --days 365
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within one process are serialised
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RAW_DATA_DIR = os.path.join('data', 'raw')
+MANIFEST_FILE = '_manifest.json'
+LOCK_FILE = '_manifest.lock'
+HASH_COLUMN = '_content_hash'
+
+_LEGACY_PATTERN = re.compile(r'^(?P<dataset>.+)_(?P<ts>\d{8}_\d{6})\.parquet$')
+
+class RawDataLake:
+    """Source/date partitioned Parquet storage with a JSON manifest."""
+
+    def __init__(self, root: str = RAW_DATA_DIR, retention_days: Optional[int] = None,
+                 small_file_rows: int = 100000):
+        self.root = root
+        self.retention_days = retention_days
+        self.small_file_rows = small_file_rows
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> 'RawDataLake':
+        """Build from the ``raw_storage`` section of data_sources.yaml."""
+        config = config or {}
+        return cls(
+            root=config.get('root', RAW_DATA_DIR),
+            retention_days=config.get('retention_days'),
+            small_file_rows=config.get('small_file_rows', 100000)
+        )
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_FILE)
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {'version': 1, 'files': []}
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextmanager
+    def _manifest_transaction(self) -> Iterator[Dict[str, Any]]:
+        """Yield the manifest as currently on disk, holding an exclusive lock; saved on exit.
+
+        Re-reading under the lock means entries written by other instances or
+        processes since this one last looked are kept, not overwritten.
+        """
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, LOCK_FILE), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    manifest = self._load_manifest()
+                    yield manifest
+                    self._save_manifest(manifest)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _abs(self, relative_path: str) -> str:
+        return os.path.join(self.root, relative_path)
+
+    def write(self, source: str, dataset: str, data: pd.DataFrame,
+              when: Optional[datetime] = None) -> str:
+        """Write one ingestion run into its source/date partition."""
+        when = when or datetime.now()
+        relative_path = os.path.join(
+            source, f"date={when.strftime('%Y-%m-%d')}", f"{dataset}_{when.strftime('%Y%m%d_%H%M%S')}.parquet"
+        )
+        path = self._abs(relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data.to_parquet(path, index=False)
+        with self._manifest_transaction() as manifest:
+            manifest['files'].append({
+                'path': relative_path,
+                'source': source,
+                'dataset': dataset,
+                'date': when.strftime('%Y-%m-%d'),
+                'rows': int(len(data)),
+                'bytes': os.path.getsize(path),
+                'created': when.isoformat(),
+                'compacted': False
+            })
+        logger.info(f"Saved raw data to {path}")
+        return path
+
+    def files(self, source: Optional[str] = None, dataset: Optional[str] = None,
+              start: Optional[date] = None, end: Optional[date] = None) -> List[str]:
+        """Paths of manifest entries matching the filters, oldest first."""
+        # The manifest is replaced atomically, so reading it needs no lock
+        entries = self._load_manifest()['files']
+        selected = []
+        for entry in entries:
+            if source and entry['source'] != source:
+                continue
+            if dataset and entry['dataset'] != dataset:
+                continue
+            if start and entry['date'] < start.isoformat():
+                continue
+            if end and entry['date'] >= end.isoformat():
+                continue
+            selected.append(entry)
+        selected.sort(key=lambda entry: entry['created'])
+        return [self._abs(entry['path']) for entry in selected]
+
+    def read(self, source: str, dataset: Optional[str] = None, start: Optional[date] = None,
+             end: Optional[date] = None) -> pd.DataFrame:
+        """Read all matching files into one frame, without the content hash column."""
+        paths = self.files(source, dataset, start, end)
+        if not paths:
+            return pd.DataFrame()
+        data = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+        return data.drop(columns=[HASH_COLUMN], errors='ignore')
+
+    def adopt_legacy_files(self) -> int:
+        """Register flat ``<source>/<dataset>_<ts>.parquet`` files written before partitioning."""
+        adopted = 0
+        if not os.path.isdir(self.root):
+            return adopted
+        with self._lock:
+            for source in sorted(os.listdir(self.root)):
+                source_dir = self._abs(source)
+                if not os.path.isdir(source_dir):
+                    continue
+                for filename in sorted(os.listdir(source_dir)):
+                    match = _LEGACY_PATTERN.match(filename)
+                    if not match:
+                        continue
+                    when = datetime.strptime(match.group('ts'), '%Y%m%d_%H%M%S')
+                    data = pd.read_parquet(os.path.join(source_dir, filename))
+                    self.write(source, match.group('dataset'), data, when=when)
+                    os.remove(os.path.join(source_dir, filename))
+                    adopted += 1
+        return adopted
+
+    def compact(self, source: Optional[str] = None) -> int:
+        """Merge each partition's small files into one deduplicated file.
+
+        Rows are deduplicated by a hash of their content, which is stored
+        alongside the data so later compactions don't have to recompute it for
+        already-compacted rows. Returns the number of files removed.
+        """
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for entry in self._load_manifest()['files']:
+            if source and entry['source'] != source:
+                continue
+            if entry['rows'] >= self.small_file_rows and not entry['compacted']:
+                continue
+            key = (entry['source'], entry['dataset'], entry['date'])
+            groups.setdefault(key, []).append(entry)
+
+        removed = 0
+        for (group_source, dataset, day), entries in groups.items():
+            if len(entries) < 2:
+                continue
+            entries.sort(key=lambda entry: entry['created'])
+            frames = []
+            for entry in entries:
+                frame = pd.read_parquet(self._abs(entry['path']))
+                if HASH_COLUMN not in frame.columns:
+                    frame[HASH_COLUMN] = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+                frames.append(frame)
+            merged = pd.concat(frames, ignore_index=True)
+            merged = merged.drop_duplicates(HASH_COLUMN, keep='last').reset_index(drop=True)
+
+            latest = datetime.fromisoformat(entries[-1]['created'])
+            relative_path = os.path.join(
+                group_source, f'date={day}', f"{dataset}_compacted_{latest.strftime('%Y%m%d_%H%M%S')}.parquet"
+            )
+            path = self._abs(relative_path)
+            tmp_path = path + '.tmp'
+            merged.to_parquet(tmp_path, index=False)
+
+            old_paths = {entry['path'] for entry in entries} - {relative_path}
+            with self._manifest_transaction() as manifest:
+                current = {entry['path'] for entry in manifest['files']}
+                if not {entry['path'] for entry in entries} <= current:
+                    # Another process compacted or expired this partition meanwhile
+                    os.remove(tmp_path)
+                    continue
+                os.replace(tmp_path, path)
+                manifest['files'] = [
+                    entry for entry in manifest['files']
+                    if entry['path'] not in old_paths and entry['path'] != relative_path
+                ]
+                manifest['files'].append({
+                    'path': relative_path,
+                    'source': group_source,
+                    'dataset': dataset,
+                    'date': day,
+                    'rows': int(len(merged)),
+                    'bytes': os.path.getsize(path),
+                    'created': latest.isoformat(),
+                    'compacted': True
+                })
+            # Delete only after the manifest no longer points at the old files
+            for old_path in old_paths:
+                if os.path.exists(self._abs(old_path)):
+                    os.remove(self._abs(old_path))
+            removed += len(old_paths)
+            logger.info(f"Compacted {len(entries)} file(s) into {path} ({len(merged)} unique rows)")
+        return removed
+
+    def apply_retention(self, retention_days: Optional[int] = None,
+                        today: Optional[date] = None) -> int:
+        """Delete files from partitions older than the retention window."""
+        retention_days = retention_days if retention_days is not None else self.retention_days
+        if retention_days is None:
+            return 0
+        cutoff = ((today or date.today()) - timedelta(days=retention_days)).isoformat()
+        with self._manifest_transaction() as manifest:
+            expired_paths = {entry['path'] for entry in manifest['files'] if entry['date'] < cutoff}
+            manifest['files'] = [
+                entry for entry in manifest['files'] if entry['path'] not in expired_paths
+            ]
+        if not expired_paths:
+            return 0
+        for relative_path in expired_paths:
+            path = self._abs(relative_path)
+            if os.path.exists(path):
+                os.remove(path)
+            partition_dir = os.path.dirname(path)
+            if os.path.isdir(partition_dir) and not os.listdir(partition_dir):
+                os.rmdir(partition_dir)
+        logger.info(f"Removed {len(expired_paths)} raw file(s) older than {cutoff}")
+        return len(expired_paths)
+
+    def maintain(self):
+        """Run one compaction and retention pass."""
+        self.compact()
+        self.apply_retention()
+
+class BackgroundCompactor(threading.Thread):
+    """Runs ``RawDataLake.maintain`` periodically off the ingestion path.
+
+    The first pass starts immediately and always completes, so ``stop()``
+    followed by ``join()`` waits for at least one full compaction and
+    retention pass.
+    """
+
+    def __init__(self, lake: RawDataLake, interval_seconds: float = 3600):
+        super().__init__(name='raw-data-compactor', daemon=True)
+        self.lake = lake
+        self.interval_seconds = interval_seconds
+        self.passes = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self.lake.maintain()
+            except Exception as e:
+                logger.error(f"Raw data compaction failed: {str(e)}")
+            self.passes += 1
+            if self._stop_event.wait(self.interval_seconds):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the partitioned raw-data lake")
+    parser.add_argument('command', choices=['compact', 'retention', 'adopt'])
+    parser.add_argument('--config', default='data/metadata/data_sources.yaml',
+                        help="Data sources config whose raw_storage section provides the defaults")
+    parser.add_argument('--root', default=None, help="Lake root (overrides raw_storage.root)")
+    parser.add_argument('--source', default=None, help="Only compact this source")
+    parser.add_argument('--days', type=int, default=None,
+                        help="Retention window in days (overrides raw_storage.retention_days)")
+    args = parser.parse_args(argv)
+
+    from .ingest_data import load_config
+
+    config = dict(load_config(args.config).get('raw_storage') or {})
+    if args.root is not None:
+        config['root'] = args.root
+    if args.days is not None:
+        config['retention_days'] = args.days
+    lake = RawDataLake.from_config(config)
+    if args.command == 'compact':
+        print(f"Removed {lake.compact(args.source)} small file(s)")
+    elif args.command == 'retention':
+        if lake.retention_days is None:
+            parser.error("no retention window: pass --days or set raw_storage.retention_days")
+        print(f"Removed {lake.apply_retention()} expired file(s)")
+    else:
+        print(f"Adopted {lake.adopt_legacy_files()} legacy file(s)")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
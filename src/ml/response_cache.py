@@ -0,0 +1,110 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+def canonical_hash(*parts: Any) -> str:
+    """Stable hash of JSON-serialisable parts, independent of dict key order."""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """Size-bounded LRU of serialised JSON responses with strong ETags.
+
+    Entries are keyed by a canonical hash of the endpoint, request body and
+    a state token (model version and predictions file signature). When the
+    state token changes, every entry is dropped, so a model swap or new
+    predictions never serve stale responses. Eviction keeps both the entry
+    count and the total body size under their limits.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[bytes, str]]' = OrderedDict()
+        self._bytes = 0
+        self._state = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def etag_for(body: bytes) -> str:
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def key(self, endpoint: str, body: Any, state: str) -> str:
+        return canonical_hash(endpoint, body, state)
+
+    def _check_state(self, state: str):
+        if state != self._state:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._state = state
+
+    def get(self, key: str, state: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            self._check_state(state)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, state: str, body: bytes) -> str:
+        """Store ``body`` and return its ETag. Bodies larger than the ceiling are not stored."""
+        etag = self.etag_for(body)
+        if len(body) > self.max_bytes:
+            return etag
+        with self._lock:
+            self._check_state(state)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = (body, etag)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+        return etag
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value matches ``etag`` (strong comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
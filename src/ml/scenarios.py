@@ -0,0 +1,91 @@
+import itertools
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .predict import FEATURE_COLUMNS, build_feature_matrix, predict_matrix, score_to_color
+
+PERTURBATION_MODES = ('add', 'multiply', 'set')
+
+def expand_scenarios(perturbations: List[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """Cartesian product of the per-feature perturbation values.
+
+    Each perturbation is ``{"feature", "values", "mode"}``; the result is one
+    ``{feature: value}`` dict per scenario.
+    """
+    for perturbation in perturbations:
+        if perturbation['feature'] not in FEATURE_COLUMNS:
+            raise ValueError(f"Unknown feature: {perturbation['feature']}")
+        if perturbation.get('mode', 'add') not in PERTURBATION_MODES:
+            raise ValueError(f"Unknown perturbation mode: {perturbation['mode']}")
+        if not perturbation['values']:
+            raise ValueError(f"No values given for feature: {perturbation['feature']}")
+    features = [p['feature'] for p in perturbations]
+    if len(set(features)) != len(features):
+        raise ValueError("Each feature may only be perturbed once")
+    return [
+        dict(zip(features, values))
+        for values in itertools.product(*(p['values'] for p in perturbations))
+    ]
+
+def _scenario_arrays(perturbations: List[Dict[str, Any]], scenarios: List[Dict[str, float]]):
+    """Per-scenario additive, multiplicative and override arrays of shape (S, F)."""
+    n_features = len(FEATURE_COLUMNS)
+    add = np.zeros((len(scenarios), n_features), dtype=np.float32)
+    mul = np.ones((len(scenarios), n_features), dtype=np.float32)
+    override = np.full((len(scenarios), n_features), np.nan, dtype=np.float32)
+    modes = {p['feature']: p.get('mode', 'add') for p in perturbations}
+    for s, scenario in enumerate(scenarios):
+        for feature, value in scenario.items():
+            i = FEATURE_COLUMNS.index(feature)
+            if modes[feature] == 'add':
+                add[s, i] = value
+            elif modes[feature] == 'multiply':
+                mul[s, i] = value
+            else:
+                override[s, i] = value
+    return add, mul, override
+
+def evaluate_scenarios(model, base: pd.DataFrame, perturbations: List[Dict[str, Any]],
+                       max_rows_per_batch: int = 100000) -> Dict[str, Any]:
+    """Score every zone in ``base`` under every scenario in the perturbation grid.
+
+    The zones x scenarios grid is built as one tiled feature matrix per chunk
+    of scenarios, sized so that no model call sees more than
+    ``max_rows_per_batch`` rows.
+    """
+    scenarios = expand_scenarios(perturbations)
+    X = build_feature_matrix(base)
+    n_zones = len(X)
+    baseline = predict_matrix(model, X)
+    baseline_colors = score_to_color(baseline)
+
+    add, mul, override = _scenario_arrays(perturbations, scenarios)
+    scores = np.empty((len(scenarios), n_zones), dtype=np.float32)
+    chunk = max(1, max_rows_per_batch // max(1, n_zones))
+    for start in range(0, len(scenarios), chunk):
+        stop = min(start + chunk, len(scenarios))
+        # (S_chunk, N, F) grid: base features with each scenario's perturbation applied
+        grid = X[np.newaxis, :, :] * mul[start:stop, np.newaxis, :] + add[start:stop, np.newaxis, :]
+        grid = np.where(np.isnan(override[start:stop, np.newaxis, :]), grid, override[start:stop, np.newaxis, :])
+        scores[start:stop] = predict_matrix(model, grid.reshape(-1, X.shape[1])).reshape(stop - start, n_zones)
+
+    transitions = []
+    for s in range(len(scenarios)):
+        colors = score_to_color(scores[s])
+        counts = {}
+        pairs, pair_counts = np.unique(np.char.add(np.char.add(baseline_colors, '->'), colors), return_counts=True)
+        for pair, count in zip(pairs, pair_counts):
+            old, new = pair.split('->')
+            if old != new:
+                counts[pair] = int(count)
+        transitions.append(counts)
+
+    return {
+        'postcodes': base['postcode'].astype(str).tolist() if 'postcode' in base.columns else [],
+        'baseline_scores': np.round(baseline, 2).tolist(),
+        'scenarios': scenarios,
+        'scores': np.round(scores.astype(float), 2).tolist(),
+        'color_transitions': transitions
+    }
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+class ModelVariant:
+    """A loaded model with a name, content version and routing weight."""
+
+    def __init__(self, name: str, model, version: Optional[str], weight: float = 1.0):
+        self.name = name
+        self.model = model
+        self.version = version
+        self.weight = weight
+
+    def describe(self) -> Dict[str, Any]:
+        return {'name': self.name, 'version': self.version, 'weight': self.weight}
+
+class ABRouter:
+    """Weighted routing of request batches between model variants.
+
+    Routing is deterministic in the routing key (the batch's postcodes), so a
+    given set of zones always lands on the same variant and cached responses
+    stay consistent with the variant that produced them.
+    """
+
+    def __init__(self, variants: List[ModelVariant]):
+        total = sum(variant.weight for variant in variants)
+        if not variants or total <= 0:
+            raise ValueError("A/B routing needs at least one variant with positive weight")
+        self.variants = variants
+        self._cumulative = np.cumsum([variant.weight / total for variant in variants])
+
+    def route(self, key: str) -> ModelVariant:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        point = int.from_bytes(digest, 'big') / 2**64
+        index = int(np.searchsorted(self._cumulative, point, side='right'))
+        return self.variants[min(index, len(self.variants) - 1)]
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [variant.describe() for variant in self.variants]
+
+class ShadowScorer:
+    """Scores a sample of live batches with a candidate model off the request path.
+
+    ``submit`` only does a random draw and hands the already-built feature
+    matrix to a single background thread; if that thread falls behind by more
+    than ``max_pending`` batches new samples are dropped rather than queued,
+    so live latency is unaffected. Results are appended to
+    ``<predictions_dir>/shadow/shadow_<date>.csv``.
+    """
+
+    def __init__(self, candidate: ModelVariant, sample_rate: float = 0.1,
+                 predictions_dir: str = 'data/predictions', max_pending: int = 32):
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.output_dir = os.path.join(predictions_dir, 'shadow')
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow-scorer')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.batches = 0
+        self.rows = 0
+        self.dropped = 0
+        self.errors = 0
+        self.color_flips = 0
+        self._abs_delta_sum = 0.0
+        self._delta_sum = 0.0
+
+    def submit(self, X: np.ndarray, postcodes: Sequence[str], live_scores: np.ndarray,
+               live_version: Optional[str]) -> bool:
+        """Maybe schedule shadow scoring of a live batch. Returns whether it was scheduled."""
+        if random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending += 1
+        self._executor.submit(self._score, np.array(X, copy=True), list(postcodes),
+                              np.array(live_scores, copy=True), live_version)
+        return True
+
+    def _score(self, X: np.ndarray, postcodes: List[str], live_scores: np.ndarray,
+               live_version: Optional[str]):
+        from .predict import predict_matrix, score_to_color
+
+        try:
+            candidate_scores = predict_matrix(self.candidate.model, X)
+            live_colors = score_to_color(live_scores)
+            candidate_colors = score_to_color(candidate_scores)
+            deltas = candidate_scores - live_scores
+            flips = live_colors != candidate_colors
+
+            records = pd.DataFrame({
+                'timestamp': datetime.now().isoformat(),
+                'postcode': postcodes,
+                'live_version': live_version,
+                'live_score': live_scores,
+                'live_color': live_colors,
+                'candidate_version': self.candidate.version,
+                'candidate_score': candidate_scores,
+                'candidate_color': candidate_colors,
+                'delta': deltas,
+                'color_flip': flips
+            })
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"shadow_{datetime.now().strftime('%Y%m%d')}.csv")
+            records.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+            with self._lock:
+                self.batches += 1
+                self.rows += len(deltas)
+                self.color_flips += int(flips.sum())
+                self._abs_delta_sum += float(np.abs(deltas).sum())
+                self._delta_sum += float(deltas.sum())
+        except Exception as e:
+            print(f"Error in shadow scoring: {str(e)}")
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'candidate': self.candidate.describe(),
+                'sample_rate': self.sample_rate,
+                'batches': self.batches,
+                'rows': self.rows,
+                'pending': self._pending,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'color_flips': self.color_flips,
+                'color_flip_rate': round(self.color_flips / self.rows, 4) if self.rows else 0.0,
+                'mean_delta': round(self._delta_sum / self.rows, 4) if self.rows else 0.0,
+                'mean_abs_delta': round(self._abs_delta_sum / self.rows, 4) if self.rows else 0.0
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,72 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from .feature_store import FeatureStore
+
+def _sentiment(values):
+    return pd.DataFrame({'postcode': list(values), 'sentiment': list(values.values())})
+
+def _parts(root, source):
+    return sorted(os.listdir(os.path.join(root, source)))
+
+def test_upsert_appends_only_changed_rows(tmp_path):
+    store = FeatureStore(root=str(tmp_path))
+    assert store.upsert('sentiment', _sentiment({'2000': 0.1, '2001': 0.2}), as_of=datetime(2026, 1, 1)) == 2
+    first = _parts(tmp_path, 'sentiment')
+
+    assert store.upsert('sentiment', _sentiment({'2000': 0.1, '2001': 0.3}), as_of=datetime(2026, 1, 2)) == 1
+    parts = _parts(tmp_path, 'sentiment')
+    assert len(parts) == 2 and parts[0] == first[0]
+
+    history = store.history('sentiment')
+    assert len(history) == 3
+    assert store.get_latest('2001')['sentiment'] == pytest.approx(0.3)
+    assert sorted(store.latest_frame()['postcode']) == ['2000', '2001']
+
+def test_refresh_picks_up_rows_written_by_another_instance(tmp_path):
+    serving = FeatureStore(root=str(tmp_path))
+    ingestion = FeatureStore(root=str(tmp_path))
+    ingestion.upsert('sentiment', _sentiment({'2000': 0.5}), as_of=datetime(2026, 1, 1))
+
+    assert serving.get_latest('2000') is None
+    assert serving.refresh() == 1
+    assert serving.get_latest('2000') == {'sentiment': 0.5}
+    assert serving.refresh() == 0
+
+def test_unchanged_upsert_in_another_instance_replaces_published_values(tmp_path):
+    serving = FeatureStore(root=str(tmp_path))
+    ingestion = FeatureStore(root=str(tmp_path))
+    ingestion.upsert('sentiment', _sentiment({'2000': 0.5, '2001': 0.25}), as_of=datetime(2026, 1, 1))
+    serving.refresh()
+    serving.publish('sentiment', {'2000': {'sentiment': 0.9}, '2002': {'sentiment': 0.7}})
+
+    # Same values as stored, so no rows change, but the batch still covers 2000
+    assert ingestion.upsert('sentiment', _sentiment({'2000': 0.5, '2001': 0.25}), as_of=datetime(2026, 1, 2)) == 0
+    serving.refresh()
+    assert serving.get_latest('2000') == {'sentiment': 0.5}
+    # Postcodes the batch did not contain keep their streamed value
+    assert serving.get_latest('2002') == {'sentiment': 0.7}
+
+def test_postcode_revision_changes_only_for_updated_postcodes(tmp_path):
+    store = FeatureStore(root=str(tmp_path))
+    store.upsert('sentiment', _sentiment({'2000': 0.5, '2001': 0.25}), as_of=datetime(2026, 1, 1))
+    before = {postcode: store.postcode_revision(postcode) for postcode in ('2000', '2001', '2002')}
+
+    store.publish('sentiment', {'2000': {'sentiment': 0.9}})
+    assert store.postcode_revision('2000') > before['2000']
+    assert store.postcode_revision('2001') == before['2001']
+    assert store.postcode_revision('2002') == before['2002'] == 0
+
+def test_point_in_time_join_reads_history_from_parts(tmp_path):
+    store = FeatureStore(root=str(tmp_path))
+    store.upsert('sentiment', _sentiment({'2000': 0.1}), as_of=datetime(2026, 1, 1))
+    store.upsert('sentiment', _sentiment({'2000': 0.4}), as_of=datetime(2026, 1, 5))
+
+    entities = pd.DataFrame({'postcode': ['2000', '2000', '2000'],
+                             'as_of': ['2025-12-31', '2026-01-03', '2026-01-06']})
+    joined = FeatureStore(root=str(tmp_path)).point_in_time_join(entities)
+    assert pd.isna(joined['sentiment'][0])
+    assert joined['sentiment'][1:].tolist() == pytest.approx([0.1, 0.4])
@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+
+from .feature_store import FeatureStore
+from .ingest_data import FileTailFeed, SentimentStreamSource
+from .raw_store import RawDataLake
+
+def _source(tmp_path, feed, feature_store=None):
+    return SentimentStreamSource({'source': 'sentiment'}, feed, feature_store,
+                                 raw_store=RawDataLake(root=str(tmp_path / 'raw')))
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+def test_file_feed_decodes_characters_split_across_reads(tmp_path):
+    path = tmp_path / 'sentiment.jsonl'
+    path.write_bytes(b'')
+    line = json.dumps({'postcode': '2000', 'sentiment_score': 0.4, 'source': 'café'},
+                      ensure_ascii=False).encode('utf-8') + b'\n'
+    split = line.index('é'.encode('utf-8')) + 1
+    source = _source(tmp_path, FileTailFeed(str(path), poll_interval=0.01))
+    source.start()
+    try:
+        time.sleep(0.05)
+        with open(path, 'ab') as f:
+            f.write(line[:split])
+        time.sleep(0.05)
+        with open(path, 'ab') as f:
+            f.write(line[split:] + b'{"postcode": "2001", "sentiment_score": 0.1, "note": "\xff"}\n')
+        _wait_for(lambda: source.stats()['events_processed'] == 2)
+        assert source._thread.is_alive()
+        assert source.stats()['events_rejected'] == 0
+    finally:
+        source.stop()
+
+def test_run_restarts_a_feed_that_raises(tmp_path):
+    class FlakyFeed:
+        calls = 0
+
+        def batches(self, stop: threading.Event):
+            FlakyFeed.calls += 1
+            if FlakyFeed.calls == 1:
+                raise OSError("feed went away")
+            yield [{'postcode': '2000', 'sentiment_score': 0.4}]
+            stop.wait()
+
+    source = _source(tmp_path, FlakyFeed())
+    source.restart_interval = 0.0
+    source.start()
+    try:
+        _wait_for(lambda: source.stats()['events_processed'] == 1)
+        assert source.stats()['feed_errors'] == 1
+    finally:
+        source.stop()
+
+def test_batch_upsert_replaces_streamed_sentiment(tmp_path):
+    import pandas as pd
+
+    serving = FeatureStore(root=str(tmp_path / 'store'))
+    source = _source(tmp_path, feed=None, feature_store=serving)
+    source.process_events([{'postcode': '2000', 'sentiment_score': 0.9}, None])
+    assert serving.get_latest('2000')['sentiment'] == 0.9
+    assert source.stats()['events_rejected'] == 1
+
+    FeatureStore(root=str(tmp_path / 'store')).upsert(
+        'sentiment', pd.DataFrame({'postcode': ['2000'], 'sentiment': [0.5]}))
+    serving.refresh()
+    assert serving.get_latest('2000')['sentiment'] == 0.5
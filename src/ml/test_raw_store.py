@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import date, datetime
+
+import pandas as pd
+import yaml
+
+from .raw_store import MANIFEST_FILE, BackgroundCompactor, RawDataLake, main
+
+def _frame(values):
+    return pd.DataFrame({'postcode': [str(v) for v in values], 'value': [float(v) for v in values]})
+
+def _manifest(root):
+    with open(os.path.join(root, MANIFEST_FILE)) as f:
+        return json.load(f)['files']
+
+def test_instances_on_same_root_keep_each_others_entries(tmp_path):
+    first = RawDataLake(root=str(tmp_path))
+    second = RawDataLake(root=str(tmp_path))
+    first.write('crime', 'stats', _frame([1]), when=datetime(2026, 1, 1, 9))
+    second.write('crime', 'stats', _frame([2]), when=datetime(2026, 1, 1, 10))
+
+    assert len(_manifest(tmp_path)) == 2
+    assert len(first.files('crime')) == 2
+    assert sorted(first.read('crime')['postcode']) == ['1', '2']
+
+def test_compact_deduplicates_and_updates_manifest(tmp_path):
+    lake = RawDataLake(root=str(tmp_path))
+    paths = [
+        lake.write('crime', 'stats', _frame([1, 2]), when=datetime(2026, 1, 1, 9)),
+        lake.write('crime', 'stats', _frame([2, 3]), when=datetime(2026, 1, 1, 10)),
+        lake.write('crime', 'stats', _frame([3]), when=datetime(2026, 1, 1, 11)),
+    ]
+    lake.write('crime', 'stats', _frame([9]), when=datetime(2026, 1, 2, 9))
+
+    assert lake.compact() == 3
+    assert not any(os.path.exists(path) for path in paths)
+
+    entries = {entry['date']: entry for entry in _manifest(tmp_path)}
+    assert len(entries) == 2
+    compacted = entries['2026-01-01']
+    assert compacted['compacted'] is True
+    assert compacted['rows'] == 3
+    assert os.path.exists(os.path.join(tmp_path, compacted['path']))
+    assert entries['2026-01-02']['compacted'] is False
+
+    data = lake.read('crime', start=date(2026, 1, 1), end=date(2026, 1, 2))
+    assert sorted(data['postcode']) == ['1', '2', '3']
+    assert '_content_hash' not in data.columns
+
+def test_compact_keeps_files_written_by_another_instance(tmp_path):
+    compactor = RawDataLake(root=str(tmp_path))
+    ingestion = RawDataLake(root=str(tmp_path))
+    compactor.write('crime', 'stats', _frame([1]), when=datetime(2026, 1, 1, 9))
+    compactor.write('crime', 'stats', _frame([2]), when=datetime(2026, 1, 1, 10))
+    ingestion.write('sentiment', 'scores', _frame([5]), when=datetime(2026, 1, 1, 11))
+
+    assert compactor.compact() == 2
+    assert len(ingestion.files('sentiment')) == 1
+    assert len(ingestion.files('crime')) == 1
+
+def test_retention_removes_only_partitions_before_cutoff(tmp_path):
+    lake = RawDataLake(root=str(tmp_path), retention_days=5)
+    old = lake.write('crime', 'stats', _frame([1]), when=datetime(2026, 1, 4, 9))
+    boundary = lake.write('crime', 'stats', _frame([2]), when=datetime(2026, 1, 5, 9))
+    recent = lake.write('crime', 'stats', _frame([3]), when=datetime(2026, 1, 9, 9))
+
+    assert lake.apply_retention(today=date(2026, 1, 10)) == 1
+    assert not os.path.exists(old)
+    assert not os.path.isdir(os.path.dirname(old))
+    assert os.path.exists(boundary) and os.path.exists(recent)
+    assert sorted(entry['date'] for entry in _manifest(tmp_path)) == ['2026-01-05', '2026-01-09']
+
+def test_retention_without_window_removes_nothing(tmp_path):
+    lake = RawDataLake(root=str(tmp_path))
+    path = lake.write('crime', 'stats', _frame([1]), when=datetime(2000, 1, 1))
+    assert lake.apply_retention() == 0
+    assert os.path.exists(path)
+
+def test_cli_reads_retention_from_config(tmp_path):
+    root = tmp_path / 'raw'
+    config_path = tmp_path / 'data_sources.yaml'
+    config_path.write_text(yaml.safe_dump({'raw_storage': {'root': str(root), 'retention_days': 30}}))
+    lake = RawDataLake(root=str(root))
+    expired = lake.write('crime', 'stats', _frame([1]), when=datetime(2000, 1, 1))
+    kept = lake.write('crime', 'stats', _frame([2]), when=datetime.now())
+
+    main(['retention', '--config', str(config_path)])
+    assert not os.path.exists(expired)
+    assert os.path.exists(kept)
+
+def test_background_compactor_completes_a_pass_when_stopped(tmp_path):
+    lake = RawDataLake(root=str(tmp_path))
+    lake.write('crime', 'stats', _frame([1]), when=datetime(2026, 1, 1, 9))
+    lake.write('crime', 'stats', _frame([1]), when=datetime(2026, 1, 1, 10))
+
+    compactor = BackgroundCompactor(lake, interval_seconds=3600)
+    compactor.start()
+    compactor.stop()
+    compactor.join(timeout=10)
+
+    assert compactor.passes == 1
+    assert len(lake.files('crime')) == 1
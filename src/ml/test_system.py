@@ -1,7 +1,7 @@
 import asyncio
 import pandas as pd
-from predict import PredictionService
-from train import ZonePredictor
+from .predict import PredictionService
+from .train import ZonePredictor
 import json
 
 async def test_system():
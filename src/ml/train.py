@@ -1,17 +1,48 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import GroupKFold, train_test_split
 from xgboost import XGBRegressor
+import xgboost as xgb
 import joblib
+import argparse
+import glob
+import itertools
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .drift import ReferenceProfile, ReservoirSample, profile_path_for
+
+FEATURES_DIR = os.path.join('data', 'processed', 'features')
+REPORTS_DIR = os.path.join('models', 'reports')
+
+# Rows sampled for the drift reference profile when training out-of-core
+PROFILE_SAMPLE_ROWS = 100000
+
+# Booster parameters a candidate or fixed parameter set doesn't specify. Shared by
+# cross-validation and the refit so both train the same model
+BASE_PARAMS = {
+    'learning_rate': 0.1,
+    'max_depth': 5
+}
+
+# Default search space for the nightly retrain
+DEFAULT_PARAM_GRID = {
+    'max_depth': [3, 5, 7],
+    'learning_rate': [0.03, 0.1],
+    'min_child_weight': [1, 5],
+    'subsample': [0.8, 1.0],
+}
 
 class ZonePredictor:
-    def __init__(self):
-        self.model = XGBRegressor(
-            n_estimators=100,
-            learning_rate=0.1,
-            max_depth=5
-        )
+    def __init__(self, params: Optional[Dict[str, Any]] = None):
+        model_params = dict(BASE_PARAMS, n_estimators=100)
+        if params:
+            model_params.update(params)
+        self.model = XGBRegressor(**model_params)
         self.features = [
             'growth_rate',
             'crime_rate',
@@ -22,32 +53,251 @@ class ZonePredictor:
             'housing_supply_encoded',
             'immigration_encoded'
         ]
-    
+
     def prepare_data(self, data):
         # Encode categorical variables
-        data['housing_supply_encoded'] = data['housing_supply'].map({
-            'High': 1.0, 'Moderate': 0.5, 'Low': 0.0
-        })
-        data['immigration_encoded'] = data['immigration'].map({
-            'Increasing': 1.0, 'Stable': 0.5, 'Decreasing': 0.0
-        })
+        if 'housing_supply' in data.columns:
+            data['housing_supply_encoded'] = data['housing_supply'].map({
+                'High': 1.0, 'Moderate': 0.5, 'Low': 0.0
+            })
+        if 'immigration' in data.columns:
+            data['immigration_encoded'] = data['immigration'].map({
+                'Increasing': 1.0, 'Stable': 0.5, 'Decreasing': 0.0
+            })
         return data
 
     def train(self, X, y):
         print("Training model...")
         self.model.fit(X, y)
-        
+
     def save_model(self, path):
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        joblib.dump(self.model, path)
+        if path.endswith('.json'):
+            # XGBoost native format, loadable without pickle compatibility issues
+            self.model.save_model(path)
+        else:
+            joblib.dump(self.model, path)
         print(f"Model saved to {path}")
 
     def load_model(self, path):
-        self.model = joblib.load(path)
+        if path.endswith('.json'):
+            self.model = XGBRegressor()
+            self.model.load_model(path)
+        else:
+            self.model = joblib.load(path)
         print(f"Model loaded from {path}")
 
-def main():
-    # Mock training data - will be replaced with real data pipeline
+def load_training_data(features_dir: str = FEATURES_DIR) -> pd.DataFrame:
+    """Load all processed feature snapshots written by DataIngestion.process_data."""
+    paths = sorted(glob.glob(os.path.join(features_dir, 'processed_data_*.parquet')))
+    if not paths:
+        raise FileNotFoundError(f"No processed feature files found in {features_dir}")
+    print(f"Loading {len(paths)} feature file(s) from {features_dir}")
+    return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+def expand_param_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Expand a dict of parameter lists into the list of all combinations."""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+# Training matrix of a search worker process, built once by _init_worker
+_WORKER_DTRAIN: Optional[xgb.DMatrix] = None
+_WORKER_FOLDS: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+
+def _init_worker(nthread: int, X: np.ndarray, y: np.ndarray,
+                 folds: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None):
+    """Pin BLAS/OpenMP pools and build the worker's DMatrix once for all its candidates."""
+    global _WORKER_DTRAIN, _WORKER_FOLDS
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(nthread)
+    _WORKER_DTRAIN = xgb.DMatrix(X, label=y, nthread=nthread)
+    _WORKER_FOLDS = folds
+
+def _cross_validate(params: Dict[str, Any], nfold: int, num_boost_round: int,
+                    early_stopping_rounds: int, nthread: int, seed: int) -> Dict[str, Any]:
+    """Run k-fold CV for one parameter set. Executed inside a worker process.
+
+    Uses the worker's precomputed folds when there are any, else ``nfold`` shuffled folds.
+    """
+    start = time.perf_counter()
+    booster_params = dict(BASE_PARAMS, **params)
+    booster_params.update(objective='reg:squarederror', eval_metric='rmse', nthread=nthread, seed=seed)
+    history = xgb.cv(
+        booster_params,
+        _WORKER_DTRAIN,
+        num_boost_round=num_boost_round,
+        nfold=nfold,
+        folds=_WORKER_FOLDS,
+        early_stopping_rounds=early_stopping_rounds,
+        seed=seed,
+        shuffle=True
+    )
+    return {
+        'params': params,
+        'best_iteration': len(history),
+        'cv_rmse_mean': float(history['test-rmse-mean'].iloc[-1]),
+        'cv_rmse_std': float(history['test-rmse-std'].iloc[-1]),
+        'train_rmse_mean': float(history['train-rmse-mean'].iloc[-1]),
+        'seconds': time.perf_counter() - start
+    }
+
+def hyperparameter_search(X: np.ndarray, y: np.ndarray,
+                          param_grid: Optional[Dict[str, List[Any]]] = None,
+                          nfold: int = 5, num_boost_round: int = 1000,
+                          early_stopping_rounds: int = 25,
+                          n_jobs: Optional[int] = None, seed: int = 42,
+                          groups: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """Cross-validate every parameter combination across a process pool.
+
+    Each worker gets ``cpu_count // n_jobs`` threads so the pool as a whole
+    uses the machine without oversubscribing it. The data is sent to each
+    worker once, when it starts, rather than with every candidate. With
+    ``groups`` (the postcode of each row) the folds come from GroupKFold, so
+    a zone's rows from different snapshots never sit on both sides of a
+    split. Results are sorted best first.
+    """
+    folds = None
+    if groups is not None:
+        n_groups = len(np.unique(groups))
+        if n_groups < 2:
+            raise ValueError("Grouped cross-validation needs at least two groups")
+        nfold = min(nfold, n_groups)
+        folds = list(GroupKFold(n_splits=nfold).split(X, y, groups))
+    candidates = expand_param_grid(param_grid or DEFAULT_PARAM_GRID)
+    cpu_count = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs or cpu_count, len(candidates)))
+    nthread = max(1, cpu_count // n_jobs)
+    print(f"Searching {len(candidates)} parameter sets with {n_jobs} worker(s) x {nthread} thread(s), "
+          f"{nfold} {'grouped' if folds is not None else 'shuffled'} folds")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                             initargs=(nthread, X, y, folds)) as executor:
+        futures = [
+            executor.submit(_cross_validate, params, nfold, num_boost_round,
+                            early_stopping_rounds, nthread, seed)
+            for params in candidates
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"  rmse={result['cv_rmse_mean']:.4f} rounds={result['best_iteration']} "
+                  f"({result['seconds']:.1f}s) {result['params']}")
+
+    return sorted(results, key=lambda r: r['cv_rmse_mean'])
+
+def train_best_model(data: pd.DataFrame, target: str = 'risk_score',
+                     output_path: str = 'models/zone_predictor.json',
+                     reports_dir: str = REPORTS_DIR, **search_kwargs) -> Tuple[ZonePredictor, Dict[str, Any]]:
+    """Search hyperparameters, refit the best set on all data and write reports."""
+    timings = {}
+    predictor = ZonePredictor()
+    data = predictor.prepare_data(data)
+
+    missing = [col for col in predictor.features + [target] if col not in data.columns]
+    if missing:
+        raise ValueError(f"Training data is missing required columns: {', '.join(missing)}")
+    data = data.dropna(subset=[target])
+    # Snapshots repeat unchanged zones; identical rows would only weight them more
+    rows = len(data)
+    data = data.drop_duplicates(subset=predictor.features + [target])
+    print(f"Dropped {rows - len(data)} duplicate row(s), {len(data)} left")
+    X = data[predictor.features].to_numpy(dtype=np.float32)
+    y = data[target].to_numpy(dtype=np.float32)
+    groups = data['postcode'].astype(str).to_numpy() if 'postcode' in data.columns else None
+
+    start = time.perf_counter()
+    results = hyperparameter_search(X, y, groups=groups, **search_kwargs)
+    timings['search_seconds'] = time.perf_counter() - start
+    best = results[0]
+
+    start = time.perf_counter()
+    # Same base parameters and seed as cross-validation, with its tuned round count
+    predictor = ZonePredictor(dict(best['params'], n_estimators=best['best_iteration'],
+                                   random_state=search_kwargs.get('seed', 42)))
+    predictor.train(X, y)
+    timings['refit_seconds'] = time.perf_counter() - start
+    predictor.save_model(output_path)
+    # Training distribution, compared against live inputs by the drift monitor
+    ReferenceProfile.from_matrix(predictor.features, X).save(profile_path_for(output_path))
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'model_path': output_path,
+        'n_rows': int(len(y)),
+        'features': predictor.features,
+        'target': target,
+        'best': best,
+        'timings': timings,
+        'candidates': results
+    }
+    os.makedirs(reports_dir, exist_ok=True)
+    report_path = os.path.join(
+        reports_dir, f"training_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Best CV rmse {best['cv_rmse_mean']:.4f} with {best['params']}")
+    print(f"Training report saved to {report_path}")
+    return predictor, report
+
+def train_streaming(features_dir: str = FEATURES_DIR, target: str = 'risk_score',
+                    output_path: str = 'models/zone_predictor.json',
+                    params: Optional[Dict[str, Any]] = None, num_boost_round: int = 200,
+                    start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    time_column: Optional[str] = None, external_memory: bool = True,
+                    batch_size: int = 65536) -> ZonePredictor:
+    """Fit fixed parameters on the full feature history with bounded memory."""
+    from .dataset import ParquetFeatureDataset
+
+    predictor = ZonePredictor()
+    dataset = ParquetFeatureDataset(features_dir, features=predictor.features, target=target,
+                                    start=start, end=end, time_column=time_column,
+                                    batch_size=batch_size)
+    if not dataset.paths:
+        raise FileNotFoundError(f"No processed feature files found in {features_dir}")
+    print(f"Streaming {len(dataset.paths)} feature file(s) from {features_dir}")
+
+    # Reference profile from a uniform sample of every row, drawn while the DMatrix is built
+    sample = ReservoirSample(PROFILE_SAMPLE_ROWS)
+    dtrain = dataset.to_dmatrix(external_memory=external_memory, sample=sample)
+    if sample.seen:
+        ReferenceProfile.from_matrix(predictor.features, sample.sample()).save(profile_path_for(output_path))
+    booster_params = dict(BASE_PARAMS, objective='reg:squarederror', tree_method='hist')
+    booster_params.update(params or {})
+    print("Training model...")
+    booster = xgb.train(booster_params, dtrain, num_boost_round=num_boost_round)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    booster.save_model(output_path)
+    print(f"Model saved to {output_path}")
+    predictor.load_model(output_path)
+    return predictor
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the zone predictor with cross-validated hyperparameter search")
+    parser.add_argument('--features-dir', default=FEATURES_DIR, help="Directory of processed_data_*.parquet files")
+    parser.add_argument('--output', default='models/zone_predictor.json', help="Where to write the best model (.json)")
+    parser.add_argument('--reports-dir', default=REPORTS_DIR, help="Directory for timing and metric reports")
+    parser.add_argument('--target', default='risk_score', help="Target column")
+    parser.add_argument('--nfold', type=int, default=5, help="Number of cross-validation folds")
+    parser.add_argument('--num-boost-round', type=int, default=1000, help="Maximum boosting rounds per candidate")
+    parser.add_argument('--early-stopping-rounds', type=int, default=25, help="Stop after this many rounds without improvement")
+    parser.add_argument('--n-jobs', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--param-grid', default=None, help="JSON dict of parameter lists overriding the default grid")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--streaming', action='store_true',
+                        help="Skip the search and fit --params out-of-core over the full history")
+    parser.add_argument('--params', default=None, help="JSON dict of booster parameters for --streaming")
+    parser.add_argument('--start', default=None, help="Only use snapshots at or after this ISO date")
+    parser.add_argument('--end', default=None, help="Only use snapshots before this ISO date")
+    parser.add_argument('--time-column', default=None,
+                        help="Filter rows on this column instead of the snapshot file timestamp")
+    parser.add_argument('--mock', action='store_true', help="Fit once on the built-in mock frame instead")
+    return parser.parse_args(argv)
+
+def train_mock():
+    # Mock training data - used when no processed features are available
     mock_data = pd.DataFrame({
         'growth_rate': [6.2, 4.8, 5.5],
         'crime_rate': [10, 30, 15],
@@ -62,12 +312,52 @@ def main():
 
     predictor = ZonePredictor()
     prepared_data = predictor.prepare_data(mock_data)
-    
+
     X = prepared_data[predictor.features]
     y = prepared_data['risk_score']
 
     predictor.train(X, y)
     predictor.save_model('models/zone_predictor.joblib')
+    ReferenceProfile.from_matrix(predictor.features, X.to_numpy(dtype=np.float64)).save(
+        profile_path_for('models/zone_predictor.joblib')
+    )
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.mock:
+        train_mock()
+        return
+    if args.streaming:
+        train_streaming(
+            features_dir=args.features_dir,
+            target=args.target,
+            output_path=args.output,
+            params=json.loads(args.params) if args.params else None,
+            num_boost_round=args.num_boost_round,
+            start=datetime.fromisoformat(args.start) if args.start else None,
+            end=datetime.fromisoformat(args.end) if args.end else None,
+            time_column=args.time_column
+        )
+        return
+
+    start = time.perf_counter()
+    data = load_training_data(args.features_dir)
+    load_seconds = time.perf_counter() - start
+
+    _, report = train_best_model(
+        data,
+        target=args.target,
+        output_path=args.output,
+        reports_dir=args.reports_dir,
+        param_grid=json.loads(args.param_grid) if args.param_grid else None,
+        nfold=args.nfold,
+        num_boost_round=args.num_boost_round,
+        early_stopping_rounds=args.early_stopping_rounds,
+        n_jobs=args.n_jobs,
+        seed=args.seed
+    )
+    print(f"Loaded data in {load_seconds:.1f}s, searched in {report['timings']['search_seconds']:.1f}s, "
+          f"refit in {report['timings']['refit_seconds']:.1f}s")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
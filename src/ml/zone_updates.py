@@ -0,0 +1,194 @@
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+ZONE_GEOJSON_PATH = 'data/filtered_postcodes.geojson'
+
+def _positions(coordinates) -> Iterable[Sequence[float]]:
+    """Every [lon, lat] position in a (Multi)Polygon coordinate tree."""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates[:2]
+    else:
+        for part in coordinates or []:
+            yield from _positions(part)
+
+def load_zone_centroids(path: str = ZONE_GEOJSON_PATH) -> Dict[str, Tuple[float, float]]:
+    """Centre of each postcode polygon's bounding box as (lon, lat), keyed by POA_CODE21."""
+    with open(path) as f:
+        data = json.load(f)
+    centroids = {}
+    for feature in data.get('features', []):
+        postcode = (feature.get('properties') or {}).get('POA_CODE21')
+        points = np.asarray(list(_positions((feature.get('geometry') or {}).get('coordinates'))), dtype=float)
+        if postcode and points.size:
+            low, high = points.min(axis=0), points.max(axis=0)
+            centroids[str(postcode)] = (float(low[0] + high[0]) / 2, float(low[1] + high[1]) / 2)
+    return centroids
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    """One server-sent event frame."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    payload = json.dumps(data, separators=(',', ':'))
+    return f"{head}event: {event}\ndata: {payload}\n\n".encode('utf-8')
+
+class ZoneSubscription:
+    """A connected client: its postcode filter (None means all zones) and outgoing queue."""
+
+    __slots__ = ('postcodes', 'queue')
+
+    def __init__(self, postcodes: Optional[Set[str]], max_pending: int):
+        self.postcodes = postcodes
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    def offer(self, message: bytes) -> bool:
+        """Queue a message; False if the client is too far behind to take it."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def replace_backlog(self, message: bytes):
+        """Drop everything still queued and send ``message`` instead."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+class ZoneUpdateHub:
+    """Fans out changed zone scores to subscribed clients.
+
+    The hub keeps the last published (score, colour, model version) per
+    postcode and only sends zones whose values changed. Subscribers are
+    indexed by postcode (a bounding box is resolved to the postcodes whose
+    centroid falls inside it when subscribing), so a publish costs
+    O(changed zones + interested subscribers) however many idle connections
+    are open. Publishing is thread-safe; delivery happens on the event loop
+    that owns the subscriptions. A client that falls ``max_pending`` events
+    behind has its backlog replaced by one ``resync`` event carrying the
+    current state of its zones.
+    """
+
+    def __init__(self, max_pending: int = 64, geojson_path: str = ZONE_GEOJSON_PATH):
+        self.max_pending = max_pending
+        self.geojson_path = geojson_path
+        self._centroids: Optional[Dict[str, Tuple[float, float]]] = None
+        self._state: Dict[str, Tuple[float, str, Optional[str]]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Only touched from the event loop thread
+        self._all: Set[ZoneSubscription] = set()
+        self._by_postcode: Dict[str, Set[ZoneSubscription]] = {}
+        self.sequence = 0
+        self.events = 0
+        self.zones_sent = 0
+        self.resyncs = 0
+
+    def postcodes_in_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> Set[str]:
+        if self._centroids is None:
+            self._centroids = load_zone_centroids(self.geojson_path)
+        return {
+            postcode for postcode, (lon, lat) in self._centroids.items()
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat
+        }
+
+    def subscribe(self, postcodes: Optional[Set[str]] = None) -> ZoneSubscription:
+        """Register a client; must be called from the event loop that will stream to it."""
+        self._loop = asyncio.get_running_loop()
+        subscription = ZoneSubscription(postcodes, self.max_pending)
+        if postcodes is None:
+            self._all.add(subscription)
+        else:
+            for postcode in postcodes:
+                self._by_postcode.setdefault(postcode, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ZoneSubscription):
+        if subscription.postcodes is None:
+            self._all.discard(subscription)
+            return
+        for postcode in subscription.postcodes:
+            subscribers = self._by_postcode.get(postcode)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_postcode[postcode]
+
+    @staticmethod
+    def _zone(postcode: str, value: Tuple[float, str, Optional[str]]) -> Dict[str, Any]:
+        score, color, version = value
+        return {'postcode': postcode, 'score': score, 'color': color, 'model_version': version}
+
+    def seed(self, postcodes: Sequence[str], scores: Sequence[float], colors: Sequence[str],
+             versions: Sequence[Optional[str]]):
+        """Set the baseline state without notifying anyone."""
+        with self._lock:
+            for postcode, score, color, version in zip(postcodes, scores, colors, versions):
+                self._state[str(postcode)] = (round(float(score), 2), str(color), version)
+
+    def publish(self, postcodes: Sequence[str], scores: Sequence[float], colors: Sequence[str],
+                versions: Sequence[Optional[str]], reason: str) -> int:
+        """Record new zone scores and push the ones that changed. Returns the number changed."""
+        changes = []
+        with self._lock:
+            for postcode, score, color, version in zip(postcodes, scores, colors, versions):
+                postcode = str(postcode)
+                value = (round(float(score), 2), str(color), version)
+                if self._state.get(postcode) != value:
+                    self._state[postcode] = value
+                    changes.append(self._zone(postcode, value))
+            if not changes:
+                return 0
+            self.sequence += 1
+            sequence = self.sequence
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch, sequence, reason, changes)
+        return len(changes)
+
+    def _offer(self, subscription: ZoneSubscription, message: bytes, sequence: int):
+        if not subscription.offer(message):
+            zones = self.snapshot(subscription.postcodes)
+            subscription.replace_backlog(format_event('resync', {'zones': zones}, sequence))
+            self.resyncs += 1
+
+    def _dispatch(self, sequence: int, reason: str, changes: List[Dict[str, Any]]):
+        deliveries = 0
+        if self._all:
+            message = format_event('zones', {'reason': reason, 'zones': changes}, sequence)
+            for subscription in self._all:
+                self._offer(subscription, message, sequence)
+            deliveries += len(self._all) * len(changes)
+
+        matched: Dict[ZoneSubscription, List[Dict[str, Any]]] = {}
+        for change in changes:
+            for subscription in self._by_postcode.get(change['postcode'], ()):
+                matched.setdefault(subscription, []).append(change)
+        for subscription, zones in matched.items():
+            message = format_event('zones', {'reason': reason, 'zones': zones}, sequence)
+            self._offer(subscription, message, sequence)
+            deliveries += len(zones)
+
+        self.events += 1
+        self.zones_sent += deliveries
+
+    def snapshot(self, postcodes: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Current state of the subscribed zones."""
+        with self._lock:
+            if postcodes is None:
+                return [self._zone(postcode, value) for postcode, value in self._state.items()]
+            return [self._zone(postcode, self._state[postcode]) for postcode in postcodes if postcode in self._state]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'subscribers': len(self._all) + len({s for subs in self._by_postcode.values() for s in subs}),
+            'subscribers_all_zones': len(self._all),
+            'watched_postcodes': len(self._by_postcode),
+            'zones_tracked': len(self._state),
+            'sequence': self.sequence,
+            'events': self.events,
+            'zones_sent': self.zones_sent,
+            'resyncs': self.resyncs
+        }